@@ -0,0 +1,69 @@
+# Developed by KuiToi Dev
+# File benchmarks/codec_offload.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Tick jitter of a 60 TPS loop while big ABG payloads are packed/unpacked,
+# with codec work inline vs offloaded to the thread pool.
+# Usage: python benchmarks/codec_offload.py [seconds]
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+_path = os.path.join(os.path.dirname(__file__), "..", "src", "core", "compression.py")
+_spec = importlib.util.spec_from_file_location("compression", _path)
+compression = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(compression)
+
+TPS = 60
+PAYLOAD = b"E:bigEvent:" + b"".join(b'{"id":%d,"name":"part_%d","value":%d.5},' % (i, i % 97, i) for i in range(400000))
+
+
+async def ticker(duration, intervals):
+    target = 1 / TPS
+    end = time.monotonic() + duration
+    last = time.monotonic()
+    while last < end:
+        await asyncio.sleep(target)
+        now = time.monotonic()
+        intervals.append(now - last)
+        last = now
+
+
+async def codec_load(policy, duration):
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        packed = await policy.pack_async(PAYLOAD)
+        await policy.unpack(packed, 100 * 1024 * 1024)
+        await asyncio.sleep(0.05)
+
+
+async def run(offload_size, duration):
+    policy = compression.CompressionPolicy(offload_size=offload_size)
+    intervals = []
+    await asyncio.gather(ticker(duration, intervals), codec_load(policy, duration))
+    policy.shutdown()
+    jitter = sorted(abs(i - 1 / TPS) * 1000 for i in intervals)
+    return {
+        "ticks": len(intervals),
+        "mean_ms": statistics.fmean(jitter),
+        "p99_ms": jitter[int(len(jitter) * 0.99) - 1],
+        "max_ms": jitter[-1],
+        "offloaded": policy.offloaded,
+    }
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Payload: {len(PAYLOAD) / 1024 / 1024:.1f}mb; {duration}s at {TPS} TPS")
+    for name, size in (("inline", float("inf")), ("offload", 256 * 1024)):
+        r = asyncio.run(run(size, duration))
+        print(f"{name:<8} ticks={r['ticks']:<5} jitter mean={r['mean_ms']:.2f}ms "
+              f"p99={r['p99_ms']:.2f}ms max={r['max_ms']:.2f}ms offloaded={r['offloaded']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Developed by KuiToi Dev
+# File benchmarks/records.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Memory of the player/car data model, N players x M cars: players with a __dict__ (plus the _unicycle and
+# last position dicts) and cars as dicts holding their own spawn packet, vs. the slotted Client and Car records
+# (packet built from a header and the shared config text, position kept raw).
+# The player attributes are the ones of Client.__slots__, read from the source; their values are the same
+# on both sides, so the difference is the record layout alone.
+# Usage: python benchmarks/records.py [players] [cars per player] [unique configs]
+import ast
+import builtins
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+_src = os.path.join(os.path.dirname(__file__), "..", "src", "core")
+builtins.KB = 1024
+
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_src, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+udp_codec = load("udp_codec")
+vehicles = load("vehicles")
+
+
+def client_slots():
+    with open(os.path.join(_src, "Client.py")) as f:
+        tree = ast.parse(f.read())
+    cls = next(n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == "Client")
+    slots = next(n for n in cls.body if isinstance(n, ast.Assign) and n.targets[0].id == "__slots__")
+    # Private names are mangled the way Python does it for Client
+    return [f"_Client{name}" if name.startswith("__") else name for name in ast.literal_eval(slots.value)]
+
+
+SLOTS = client_slots()
+DictPlayer = type("DictPlayer", (), {})
+SlotPlayer = type("SlotPlayer", (), {"__slots__": tuple(SLOTS)})
+
+
+def make_config(rnd, n):
+    return json.dumps({"jbm": f"model_{n}", "vcf": {
+        "parts": {f"part_slot_{i}": f"part_{rnd.randrange(1000)}" for i in range(300)},
+        "vars": {f"$var_{i}": rnd.random() for i in range(40)}}}, separators=(",", ":"))
+
+
+POSITION = b'{"pos":[1234.567,-2345.678,101.234],"rot":[0.001,0.002,0.7,0.71],"vel":[12.3,4.5,0.1],' \
+           b'"rvel":[0.01,0.02,0.03],"tim":123.456,"ping":0.05}'
+
+
+def build_dicts(players, cars, configs, store):
+    out = []
+    for cid in range(players):
+        player = DictPlayer()
+        for name in SLOTS:
+            setattr(player, name, 0)
+        player._unicycle = {"id": -1, "packet": ""}
+        player._cars = [None] * 21
+        for car_id in range(cars):
+            text, car_json = store.put(configs[(cid * cars + car_id) % len(configs)])
+            player._cars[car_id] = {"packet": f"Os:USER:player_{cid}:{cid}-{car_id}:" + text, "json": car_json,
+                                    "json_ok": True, "unicycle": False, "over_spawn": False,
+                                    "pos": udp_codec.Position(POSITION[:])}
+            player._last_position = player._cars[car_id]["pos"]
+        out.append(player)
+    return out
+
+
+def build_slots(players, cars, configs, store):
+    out = []
+    for cid in range(players):
+        player = SlotPlayer()
+        for name in SLOTS:
+            setattr(player, name, 0)
+        player._unicycle_id = -1
+        player._cars = [None] * 21
+        for car_id in range(cars):
+            text, car_json = store.put(configs[(cid * cars + car_id) % len(configs)])
+            player._cars[car_id] = vehicles.Car(f"Os:USER:player_{cid}:{cid}-{car_id}:", text, car_json,
+                                                False, False, udp_codec.Position(POSITION[:]))
+            player._last_position = player._cars[car_id].pos
+        out.append(player)
+    return out
+
+
+def measure(build, *args):
+    tracemalloc.start()
+    result = build(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timeit(func, rounds=200000):
+    t = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - t) / rounds * 1e9
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cars = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    unique = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    rnd = random.Random(1)
+    configs = [make_config(rnd, n) for n in range(unique)]
+    print(f"{players} players x {cars} cars; {len(SLOTS)} player attributes; "
+          f"{unique} unique configs of ~{sum(map(len, configs)) // unique / 1024:.1f} KB")
+    # Configs are shared through ConfigStore on both sides; it's filled beforehand and not counted
+    store = vehicles.ConfigStore()
+    for text in configs:
+        store.put(text)
+
+    dicts, dicts_size = measure(build_dicts, players, cars, configs, store)
+    slots, slots_size = measure(build_slots, players, cars, configs, store)
+    print(f"dicts  {dicts_size / 1024 / 1024:>8.2f} MB; {dicts_size / players / 1024:>7.1f} KB per player")
+    print(f"slots  {slots_size / 1024 / 1024:>8.2f} MB; {slots_size / players / 1024:>7.1f} KB per player "
+          f"(x{dicts_size / slots_size:.1f} less memory)")
+    one_dict, one_dict_size = measure(build_dicts, 1, 0, configs, store)
+    one_slot, one_slot_size = measure(build_slots, 1, 0, configs, store)
+    print(f"player record alone: dicts {one_dict_size} B; slots {one_slot_size} B")
+    assert dict(slots[0]._cars[0]) == dicts[0]._cars[0]
+
+    player, car = dicts[0], dicts[0]._cars[0]
+    d = timeit(lambda: (player._cid, player.nick, car["pos"]))
+    player, car = slots[0], slots[0]._cars[0]
+    s = timeit(lambda: (player._cid, player.nick, car.pos))
+    print(f"hot handler reads (cid, nick, car pos): dicts {d:.1f} ns; slots {s:.1f} ns (x{d / s:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Developed by KuiToi Dev
+# File benchmarks/udp_codec.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Position packets/s on one core through the UDP handling path (parse, decode, build the relay payload):
+# old str path (two decode()s, str cid/vid parsing, json.loads(str), bytes(data) re-encode for the relay)
+# vs. the bytes-native udp_codec (cid/vid from bytes, only the JSON slice decoded, datagram slice relayed)
+# vs. lazy decoding (JSON kept raw in a Position, [x, y, z] read from the bytes for the spatial index).
+# Usage: python benchmarks/udp_codec.py [packets]
+import importlib.util
+import json
+import os
+import sys
+import time
+
+_path = os.path.join(os.path.dirname(__file__), "..", "src", "core", "udp_codec.py")
+_spec = importlib.util.spec_from_file_location("udp_codec", _path)
+udp_codec = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(udp_codec)
+
+PACKET = b'\x04:Zp:3-0:{"pos":[1234.567,-2345.678,101.234],"rot":[0.001,0.002,0.7,0.71],"vel":[12.3,4.5,0.1],' \
+         b'"rvel":[0.01,0.02,0.03],"tim":123.456,"ping":0.05}'
+
+
+def get_cid_vid(data):
+    # Client._get_cid_vid before the codec
+    sep = data.find(":", 1) + 1
+    s = data[sep:sep + 3]
+    id_sep = s.find('-')
+    if id_sep == -1:
+        return -1, -1
+    cid = s[:id_sep]
+    vid = s[id_sep + 1:]
+    if cid.isdigit() and vid.isdigit():
+        return int(cid), int(vid)
+    return -1, -1
+
+
+def old_path(packet):
+    code = packet[2:3].decode()
+    data = packet[2:].decode()
+    if code == "Z":
+        sub = data.find("{", 1)
+        _, car_id = get_cid_vid(data)
+        pos = json.loads(data[sub:])
+        return car_id, pos, bytes(data, "utf-8")
+
+
+def new_path(packet):
+    code = udp_codec.code(packet)
+    payload = packet[udp_codec.HEADER:]
+    if code == b"Z":
+        _, car_id, sub = udp_codec.parse_ids(packet)
+        pos = json.loads(packet[sub:].decode())
+        return car_id, pos, payload
+
+
+def lazy_path(packet):
+    # What Client does now while nobody listens to onChangePosition or reads the stored position
+    payload = packet[udp_codec.HEADER:]
+    if udp_codec.code(packet) == b"Z":
+        _, car_id, sub = udp_codec.parse_ids(packet)
+        position = udp_codec.Position(packet[sub:])
+        pos = udp_codec.parse_pos(packet, sub)
+        return car_id, position, pos, payload
+
+
+def header_only(packet):
+    # What's left when the JSON isn't needed (e.g. no culling/LOD/listeners)
+    payload = packet[udp_codec.HEADER:]
+    if udp_codec.code(packet) == b"Z":
+        _, car_id, _ = udp_codec.parse_ids(packet)
+        return car_id, payload
+
+
+def run(path, total):
+    t = time.perf_counter()
+    for _ in range(total):
+        path(PACKET)
+    return total / (time.perf_counter() - t)
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    assert old_path(PACKET) == new_path(PACKET)
+    car_id, position, pos, payload = lazy_path(PACKET)
+    assert (car_id, position.value, payload) == new_path(PACKET) and pos == position["pos"]
+    print(f"{total} position packets of {len(PACKET)} bytes")
+    results = {}
+    for name, path in (("str", old_path), ("bytes", new_path), ("lazy", lazy_path), ("ids", header_only)):
+        results[name] = run(path, total)
+        print(f"{name:<6} {results[name]:>10.0f} packets/s")
+    print(f"bytes x{results['bytes'] / results['str']:.2f}; lazy x{results['lazy'] / results['str']:.2f}; "
+          f"ids x{results['ids'] / results['str']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
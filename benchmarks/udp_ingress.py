@@ -0,0 +1,123 @@
+# Developed by KuiToi Dev
+# File benchmarks/udp_ingress.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Datagrams/s through the UDP ingress path (lookup client, update _udp_sock, enqueue, consume):
+# a task + await Queue.put() per datagram (old UDPServer.handle_datagram) vs. the synchronous
+# put_nowait() path in datagram_received. Datagrams are fed straight into the protocol callback
+# in bursts, as the event loop does for a busy socket.
+# Usage: python benchmarks/udp_ingress.py [players] [datagrams]
+import asyncio
+import sys
+import time
+
+PACKET = b'Zp:0-0:{"pos":[1.5,2.5,3.5],"rot":[0,0,0,1],"vel":[0,0,0],"rvel":[0,0,0],"tim":1,"ping":0.1}'
+BURST = 64
+
+
+class Client:
+    def __init__(self, cid):
+        self.cid = cid
+        self.alive = True
+        self._udp_sock = (None, None)
+        self.queue = asyncio.Queue()
+        self.handled = 0
+
+    async def _udp_put(self, packet):
+        await self.queue.put(packet)
+
+    def _udp_put_nowait(self, packet):
+        self.queue.put_nowait(packet)
+
+    async def consume(self):
+        while True:
+            await self.queue.get()
+            self.handled += 1
+
+
+class Core:
+    def __init__(self, players):
+        self.clients_by_id = {cid: Client(cid) for cid in range(players)}
+
+    def get_client(self, cid=None):
+        return self.clients_by_id.get(cid)
+
+
+class TaskPerDatagram:
+    transport = object()
+
+    def __init__(self, core):
+        self._core = core
+        self.loop = asyncio.get_running_loop()
+
+    async def handle_datagram(self, packet, addr):
+        client = self._core.get_client(cid=packet[0] - 1)
+        if client:
+            if client._udp_sock != (self.transport, addr):
+                client._udp_sock = (self.transport, addr)
+            await client._udp_put(packet)
+
+    def datagram_received(self, packet, addr):
+        self.loop.create_task(self.handle_datagram(packet, addr))
+
+
+class Synchronous:
+    transport = object()
+
+    def __init__(self, core):
+        self._core = core
+
+    def datagram_received(self, packet, addr):
+        client = self._core.get_client(cid=packet[0] - 1)
+        if client:
+            sock = client._udp_sock
+            if sock[1] != addr or sock[0] is not self.transport:
+                client._udp_sock = (self.transport, addr)
+            client._udp_put_nowait(packet)
+
+
+async def run(protocol_cls, players, total):
+    core = Core(players)
+    protocol = protocol_cls(core)
+    consumers = [asyncio.create_task(c.consume()) for c in core.clients_by_id.values()]
+    packets = [(bytes([cid + 1]) + b":" + PACKET, ("127.0.0.1", 40000 + cid)) for cid in range(players)]
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    sent = 0
+
+    def burst():
+        nonlocal sent
+        for _ in range(BURST):
+            packet, addr = packets[sent % players]
+            protocol.datagram_received(packet, addr)
+            sent += 1
+        if sent < total:
+            loop.call_soon(burst)
+        else:
+            done.set_result(None)
+
+    t = time.perf_counter()
+    loop.call_soon(burst)
+    await done
+    while sum(c.handled for c in core.clients_by_id.values()) < total:
+        await asyncio.sleep(0)
+    spent = time.perf_counter() - t
+    for task in consumers:
+        task.cancel()
+    return total / spent
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    print(f"{players} players; {total} datagrams; bursts of {BURST}")
+    results = {}
+    for name, cls in (("task", TaskPerDatagram), ("sync", Synchronous)):
+        results[name] = asyncio.run(run(cls, players, total))
+        print(f"{name:<5} {results[name]:>10.0f} datagrams/s")
+    print(f"x{results['sync'] / results['task']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Developed by KuiToi Dev
+# File benchmarks/udp_lod.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Outbound position traffic with and without LODRelay: N players, one car each, driving around
+# a map in small groups, every car sends 20 position packets per second (simulated time).
+# Usage: python benchmarks/udp_lod.py [players] [seconds] [near] [far]
+import builtins
+import importlib.util
+import math
+import os
+import random
+import sys
+import time
+
+
+def load(name):
+    path = os.path.join(os.path.dirname(__file__), "..", "src", "core", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+builtins.KB = 1024
+spatial = load("spatial")
+lod = load("lod")
+
+RATE = 20
+PACKET = b'Zp:0-0:{"pos":[1234.567,-2345.678,101.234],"rot":[0.001,0.002,0.7,0.71],"vel":[12.3,4.5,0.1],' \
+         b'"rvel":[0.01,0.02,0.03],"tim":123.456,"ping":0.05}'
+
+
+class Player:
+    def __init__(self, cid, rnd, groups):
+        self.cid = cid
+        cx, cy = groups[cid % len(groups)]
+        self.pos = [cx + rnd.uniform(-100, 100), cy + rnd.uniform(-100, 100), 0.0]
+        self.heading = rnd.uniform(0, 2 * math.pi)
+        self.speed = rnd.uniform(5, 30)
+        self.received = 0
+        self.received_bytes = 0
+
+    def move(self, dt):
+        self.pos = [self.pos[0] + math.cos(self.heading) * self.speed * dt,
+                    self.pos[1] + math.sin(self.heading) * self.speed * dt, 0.0]
+
+    def _send_udp(self, payload):
+        self.received += 1
+        self.received_bytes += len(payload)
+
+
+def run(players_count, seconds, near, far):
+    rnd = random.Random(1)
+    groups = [(rnd.uniform(-2000, 2000), rnd.uniform(-2000, 2000)) for _ in range(max(1, players_count // 6))]
+    players = [Player(cid, rnd, groups) for cid in range(players_count)]
+    index = spatial.SpatialGrid(100)
+    relay = lod.LODRelay(near, far)
+    relay.index = index
+    now = 0.0
+    relay.clock = lambda: now
+    dt = 1 / RATE
+    t = time.perf_counter()
+    for step in range(int(seconds * RATE)):
+        now = step * dt
+        for p in players:
+            p.move(dt)
+            pos = p.pos
+            index.update((p.cid, 0), pos)
+            for r in players:
+                if r is p:
+                    continue
+                if relay.enabled:
+                    relay.relay(p, 0, pos, PACKET, r)
+                else:
+                    r._send_udp(PACKET)
+        relay.flush()
+    spent = time.perf_counter() - t
+    return sum(p.received for p in players), sum(p.received_bytes for p in players), spent, relay
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    near = float(sys.argv[3]) if len(sys.argv) > 3 else 150
+    far = float(sys.argv[4]) if len(sys.argv) > 4 else 500
+    print(f"{players} players; {seconds:.0f}s at {RATE} packets/s per car; near {near:.0f}m; far {far:.0f}m")
+    base, base_bytes, base_spent, _ = run(players, seconds, 0, 0)
+    sent, sent_bytes, spent, relay = run(players, seconds, near, far)
+    print(f"no LOD  {base:>9} datagrams; {base_bytes / 1024 / seconds:>9.1f} KB/s out; {base_spent:.2f}s CPU")
+    print(f"LOD     {sent:>9} datagrams; {sent_bytes / 1024 / seconds:>9.1f} KB/s out; {spent:.2f}s CPU")
+    print(f"saved {(1 - sent_bytes / base_bytes) * 100:.1f}% of outbound position bytes")
+    print(relay.parse_console([]))
+
+
+if __name__ == "__main__":
+    main()
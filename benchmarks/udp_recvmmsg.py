@@ -0,0 +1,89 @@
+# Developed by KuiToi Dev
+# File benchmarks/udp_recvmmsg.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# UDP ingress over loopback: the socket is filled with a burst of position packets from
+# N clients, then the event loop drains it into datagram_received().
+# Default transport reader (one recvfrom() per wakeup) vs. UDPBatchReader (recvmmsg()).
+# Usage: python benchmarks/udp_recvmmsg.py [clients] [burst] [rounds]
+import asyncio
+import importlib.util
+import os
+import socket
+import sys
+import time
+
+_path = os.path.join(os.path.dirname(__file__), "..", "src", "core", "udp_batch.py")
+_spec = importlib.util.spec_from_file_location("udp_batch", _path)
+udp_batch = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(udp_batch)
+
+PACKET = b'Zp:0-0:{"pos":[1.5,2.5,3.5],"rot":[0,0,0,1],"vel":[0,0,0],"rvel":[0,0,0],"tim":1,"ping":0.1}'
+
+
+class Protocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = 0
+        self.target = 0
+        self.done = None
+        self.reader = None
+
+    def datagram_received(self, packet, addr):
+        self.received += 1
+        if self.received == self.target:
+            self.done.set_result(None)
+
+    def connection_lost(self, exc):
+        if self.reader:
+            self.reader.close()
+
+
+async def run(batch, clients, burst, rounds):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(Protocol, local_addr=("127.0.0.1", 0))
+    transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 << 20)
+    if batch:
+        protocol.reader = udp_batch.create_reader(transport, protocol, batch)
+        protocol.reader.start()
+    addr = transport.get_extra_info("sockname")
+    sockets = []
+    for _ in range(clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sockets.append(sock)
+    spent = 0.0
+    for _ in range(rounds):
+        protocol.target += burst
+        protocol.done = loop.create_future()
+        for i in range(burst):
+            sockets[i % clients].sendto(PACKET, addr)
+        t = time.perf_counter()
+        await protocol.done
+        spent += time.perf_counter() - t
+    transport.close()
+    for sock in sockets:
+        sock.close()
+    await asyncio.sleep(0)
+    return burst * rounds / spent, protocol.reader
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    print(f"{clients} clients; {rounds} bursts of {burst} datagrams")
+    if udp_batch.create_reader.__globals__["_load_recvmmsg"]() is None:
+        print("recvmmsg() is not available here.")
+        return
+    base = None
+    for batch in (0, 16, 64, 256):
+        rate, reader = asyncio.run(run(batch, clients, burst, rounds))
+        base = base or rate
+        name = f"recvmmsg({batch})" if batch else "recvfrom"
+        extra = f"; avg burst {reader.received / reader.bursts:.1f}" if reader else ""
+        print(f"{name:<14} {rate:>10.0f} datagrams/s; x{rate / base:.2f}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Developed by KuiToi Dev
+# File benchmarks/vehicle_table.py
+# Written by: SantaSpeen
+# Licence: FPA
+# (c) kuitoi.su 2024
+# Vehicle state memory and bulk query time: the old per-car dicts (own json.loads of the config and of the last
+# position packet per car) vs. what Client keeps now: the car dict with the config shared through ConfigStore,
+# the raw position JSON and a VehicleTable row (pos/rot/vel/... in array('d') columns).
+# Usage: python benchmarks/vehicle_table.py [cars] [unique configs]
+import builtins
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+_path = os.path.join(os.path.dirname(__file__), "..", "src", "core", "vehicles.py")
+_spec = importlib.util.spec_from_file_location("vehicles", _path)
+vehicles = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(vehicles)
+_path = os.path.join(os.path.dirname(__file__), "..", "src", "core", "udp_codec.py")
+_spec = importlib.util.spec_from_file_location("udp_codec", _path)
+udp_codec = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(udp_codec)
+builtins.KB = 1024
+
+
+def make_config(rnd, n):
+    # A vehicle config: model, paint and a few hundred parts
+    return json.dumps({"jbm": f"model_{n}", "vcf": {
+        "parts": {f"part_slot_{i}": f"part_{rnd.randrange(1000)}" for i in range(300)},
+        "paints": [{"baseColor": [rnd.random() for _ in range(4)], "metallic": 0.5}] * 3,
+        "vars": {f"$var_{i}": rnd.random() for i in range(40)}}}, separators=(",", ":"))
+
+
+def make_position(rnd):
+    return json.dumps({"pos": [rnd.uniform(-2000, 2000) for _ in range(3)], "rot": [rnd.random() for _ in range(4)],
+                       "vel": [rnd.uniform(-30, 30) for _ in range(3)], "rvel": [rnd.random() for _ in range(3)],
+                       "tim": rnd.uniform(0, 1000), "ping": 0.05}, separators=(",", ":")).encode()
+
+
+def build_dicts(cars, configs, positions):
+    # One dict per car with its own parsed config and parsed last position, as in Client._cars
+    out = {}
+    for n in range(cars):
+        text = configs[n % len(configs)]
+        out[(n // 4, n % 4)] = {"packet": f"Os:USER:player_{n // 4}:{n // 4}-{n % 4}:" + text,
+                                "json": json.loads(text), "json_ok": True, "unicycle": False,
+                                "over_spawn": False, "pos": json.loads(positions[n].decode())}
+    return out
+
+
+def build_table(cars, configs, positions):
+    table = vehicles.VehicleTable()
+    out = {}
+    for n in range(cars):
+        key = (n // 4, n % 4)
+        text, car_json = table.configs.put(configs[n % len(configs)])
+        table.add(key, text)
+        raw = positions[n]
+        out[key] = {"packet": f"Os:USER:player_{n // 4}:{n // 4}-{n % 4}:" + text,
+                    "json": car_json, "json_ok": True, "unicycle": False,
+                    "over_spawn": False, "pos": udp_codec.Position(raw)}
+        table.update(key, udp_codec.parse_pos(raw), raw)
+    return table, out
+
+
+def measure(build, *args):
+    tracemalloc.start()
+    t = time.perf_counter()
+    result = build(*args)
+    spent = time.perf_counter() - t
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, spent
+
+
+def timeit(func, rounds=20):
+    t = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - t) / rounds
+
+
+def main():
+    cars = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    unique = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    rnd = random.Random(1)
+    configs = [make_config(rnd, n) for n in range(unique)]
+    positions = [make_position(rnd) for _ in range(cars)]
+    print(f"{cars} cars; {unique} unique configs of ~{sum(map(len, configs)) // unique / 1024:.1f} KB")
+
+    dicts, dicts_size, dicts_spent = measure(build_dicts, cars, configs, positions)
+    (table, _), table_size, table_spent = measure(build_table, cars, configs, positions)
+    print(f"before {dicts_size / 1024 / 1024:>8.1f} MB; built in {dicts_spent:.2f}s")
+    print(f"now    {table_size / 1024 / 1024:>8.1f} MB; built in {table_spent:.2f}s "
+          f"(x{dicts_size / table_size:.1f} less memory)")
+
+    all_dicts = lambda: [c["pos"]["pos"] for c in dicts.values()]  # noqa: E731
+    all_table = lambda: table.column("pos")  # noqa: E731
+    assert [list(p) for p in all_dicts()] == [all_table()[1][i * 3:i * 3 + 3].tolist() for i in range(cars)]
+    d, t = timeit(all_dicts), timeit(all_table)
+    print(f"all positions: dicts {d * 1e6:>8.1f} us; table {t * 1e6:>8.1f} us (x{d / t:.1f})")
+    vel_dicts = lambda: [c["pos"]["vel"] for c in dicts.values()]  # noqa: E731
+    d = timeit(vel_dicts)
+    t = time.perf_counter()
+    table.column("vel")  # Parses the JSON of the cars that moved since the last query
+    first = time.perf_counter() - t
+    t = timeit(lambda: table.column("vel"))
+    print(f"all velocities: dicts {d * 1e6:>8.1f} us; table {t * 1e6:>8.1f} us (x{d / t:.1f}), "
+          f"{first * 1e6:.1f} us for the first query after a packet from every car")
+    print(table.parse_console([]))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,26 @@ import math
 import time
 import zlib
 from asyncio import Queue
+from collections import deque
 
-from core import utils
+from core import utils, udp_codec
+from core.culling import Culling
+from core.tcp_protocol import FrameError
+from core.udp_inbox import UDPInbox
+from core.vehicles import Car
 
 
 class Client:
+    __slots__ = ("__reader", "__writer", "_core", "__alive", "__queue_tpc", "_udp_inbox",
+                 "__out", "__out_size", "__out_event", "__out_idle", "__out_hold", "__out_task", "_out_dropped",
+                 "_tpc_count_recv", "_udp_count_recv", "_tpc_count_total_recv", "_udp_count_total_recv",
+                 "_udp_size_total_recv", "_tpc_size_total_recv", "_tpc_count_total_sent", "_udp_count_total_sent",
+                 "_udp_size_total_sent", "_tpc_size_total_sent", "tcp_pps", "udp_pps",
+                 "__tasks", "__removed", "_down_sock", "_udp_sock", "_loop", "_log", "_addr",
+                 "_cid", "_key", "nick", "roles", "_guest", "_synced", "_ready", "_identifiers",
+                 "_cars", "_focus_car", "_unicycle_id", "_connect_time", "_last_position", "_last_recv")
+    _droppable = b"VWY"  # Vehicle state packets, next one supersedes the previous
+    _relay_codes = b"VWYEN"  # Forwarded to everyone else without decoding
 
     def __init__(self, reader, writer, core):
         self.__reader = reader
@@ -23,7 +38,17 @@ class Client:
         self.__alive = True
 
         self.__queue_tpc = Queue()
-        self.__queue_udp = Queue()
+        self._udp_inbox = UDPInbox()  # Last position per car + pings + the rest
+
+        # Outbound TCP queue, flushed by __writer_loop
+        self.__out = deque()
+        self.__out_size = 0
+        self.__out_event = asyncio.Event()
+        self.__out_idle = asyncio.Event()
+        self.__out_idle.set()
+        self.__out_hold = False
+        self.__out_task = None
+        self._out_dropped = 0
 
         self._tpc_count_recv = 0
         self._udp_count_recv = 0
@@ -43,6 +68,7 @@ class Client:
         self.udp_pps = 0
 
         self.__tasks = []
+        self.__removed = False
         self._down_sock = (None, None)
         self._udp_sock = (None, None)
         self._loop = asyncio.get_event_loop()
@@ -58,9 +84,9 @@ class Client:
         self._identifiers = []
         self._cars = [None] * 21  # Max 20 cars per player + 1 snowman
         self._focus_car = -1
-        self._unicycle = {"id": -1, "packet": ""}
+        self._unicycle_id = -1
         self._connect_time = 0
-        self._last_position = {}
+        self._last_position = udp_codec.Position()
         self._last_recv = time.monotonic()
 
     @property
@@ -109,7 +135,7 @@ class Client:
 
     @property
     def cars(self):
-        return {i: v for i, v in enumerate(self._cars) if v is not None}
+        return {i: v.to_dict() for i, v in enumerate(self._cars) if v is not None}
 
     @property
     def focus_car(self):
@@ -117,7 +143,7 @@ class Client:
 
     @property
     def last_position(self):
-        return self._last_position
+        return self._last_position.value
 
     def _update_logger(self):
         self._log = utils.get_logger(f"{self.nick}:{self.cid}")
@@ -144,7 +170,12 @@ class Client:
             return
         self.log.info(i18n.client_kicked.format(reason))
         await self._send(f"K{reason}")
+        self._stop()
+
+    def _stop(self):
+        # Nothing more is read from a kicked client; _remove_me() closes the connection once K is sent
         self.__alive = False
+        self.__reader.stop_frames()
 
     async def send_message(self, message, to_all=True):
         if not message:
@@ -169,121 +200,191 @@ class Client:
             return
         await self._send(f"E:{event_name}:{event_data}", to_all, True)
 
-    async def _send(self, data, to_all=False, to_self=True, to_udp=False, writer=None):
+    async def _pack(self, data):
+        return await self._core.compression.pack_async(data)
 
+    @staticmethod
+    def _frame(payload):
         # TNetwork.cpp; Line: 383
         # BeamMP TCP protocol sends a header of 4 bytes, followed by the data.
         # [][][][][][]...[]
         # ^------^^---...-^
         #  size     data
+        return len(payload).to_bytes(4, "little", signed=True) + payload
 
+    async def _send(self, data, to_all=False, to_self=True, to_udp=False):
         if type(data) == str:
             data = bytes(data, config.enc)
 
         if to_all:
-            code = chr(data[0])
+            # Encode once: every recipient gets the same wire frame
+            if to_udp and chr(data[0]) in ['V', 'W', 'Y', 'E']:
+                to_udp = False
+            payload = await self._pack(data)
+            frame = None if to_udp else self._frame(payload)
             for client in self._core.clients:
                 if not client or (client is self and not to_self):
                     continue
-                if not to_udp or code in ['V', 'W', 'Y', 'E']:
-                    await client._send(data)
+                if to_udp:
+                    client._send_udp(payload)
                 else:
-                    await client._send(data, to_udp=to_udp)
+                    client._write_frame(frame)
             return
 
         if not self.__alive:
             return False
 
-        if writer is None:
-            writer = self.__writer
+        payload = await self._pack(data)
+        if to_udp:
+            self._send_udp(payload)
+            return
+        return self._write_frame(self._frame(payload))
 
-        if len(data) > 400:
-            data = b"ABG:" + zlib.compress(data, level=zlib.Z_BEST_COMPRESSION)
+    async def _send_position(self, data, car_id, pos):
+        culling, lod = self._core.culling, self._core.lod
+        if pos is None or (type(culling) is Culling and not lod.enabled):
+            return await self._send(data, True, False, True)
+        payload = await self._pack(data)
+        for client in self._core.clients:
+            if client and client is not self and culling.allow(self, car_id, pos, client):
+                if lod.enabled:
+                    lod.relay(self, car_id, pos, payload, client)
+                else:
+                    client._send_udp(payload)
 
-        if to_udp:
-            udp_sock, udp_addr = self._udp_sock
-            # self.log.debug(f'[UDP] len: {len(data)}; send: {data!r}')
-            if udp_sock and udp_addr:
-                try:
-                    if not udp_sock.is_closing():
-                        # self.log.debug(f'[UDP] {data!r}; {udp_addr}')
-                        self._udp_count_total_sent += 1
-                        self._udp_size_total_sent += len(data)
-                        udp_sock.sendto(data, udp_addr)
-                except OSError:
-                    self.log.debug("[UDP] Error sending")
-                except Exception as e:
-                    self.log.debug(f"[UDP] Error sending: {e}")
-                    self.log.exception(e)
+    def _send_udp(self, payload):
+        if not self.__alive:
             return
+        udp_sock, udp_addr = self._udp_sock
+        # self.log.debug(f'[UDP] len: {len(payload)}; send: {payload!r}')
+        if udp_sock and udp_addr:
+            try:
+                if not udp_sock.is_closing():
+                    # self.log.debug(f'[UDP] {payload!r}; {udp_addr}')
+                    self._udp_count_total_sent += 1
+                    self._udp_size_total_sent += len(payload)
+                    udp_sock.sendto(payload, udp_addr)
+            except OSError:
+                self.log.debug("[UDP] Error sending")
+            except Exception as e:
+                self.log.debug(f"[UDP] Error sending: {e}")
+                self.log.exception(e)
 
-        header = len(data).to_bytes(4, "little", signed=True)
-        data = header + data
-        # self.log.debug(f'[TCP] {data!r}')
-        try:
-            self._tpc_count_total_sent += 1
-            self._tpc_size_total_sent += len(data)
-            writer.write(data)
-            await writer.drain()
-            return True
-        except Exception as e:
-            self.log.debug(f'[TCP] Disconnected: {e}')
-            self.__alive = False
-            await self._remove_me()
+    def _write_frame(self, frame):
+        if not self.__alive:
             return False
-
-    async def _recv(self, one=False):
-        while self.__alive:
+        # Only what's already queued counts: a single big frame to an idle client is fine
+        backlog = self.__out_size
+        if backlog > config.Options['send_queue_high'] * MB:
+            if frame[4] in self._droppable:
+                self._out_dropped += 1
+                return False
+            if not self.__out_hold and backlog > config.Options['send_queue_kick'] * MB:
+                self._drop_slow()
+                return False
+        # self.log.debug(f'[TCP] {frame!r}')
+        self._tpc_count_total_sent += 1
+        self._tpc_size_total_sent += len(frame)
+        self.__out.append(frame)
+        self.__out_size = backlog + len(frame)
+        self.__out_idle.clear()
+        self.__out_event.set()
+        if self.__out_task is None:
+            self.__out_task = self._loop.create_task(self.__writer_loop())
+            self.__tasks.append(self.__out_task)
+        return True
+
+    def _drop_slow(self):
+        self.log.warning(f"Slow connection: {self.__out_size / MB:.2f}mb in send queue; "
+                         f"Dropped packets: {self._out_dropped}")
+        self.log.info(i18n.client_kicked.format("Slow connection"))
+        self.__out.clear()
+        self.__out_size = 0
+        self.__out.append(self._frame(b"KSlow connection"))
+        self.__out_event.set()
+        self._stop()
+
+    async def __writer_loop(self):
+        writer = self.__writer
+        while True:
+            while not self.__out or self.__out_hold:
+                if not self.__out:
+                    self.__out_idle.set()
+                self.__out_event.clear()
+                await self.__out_event.wait()
+            frames = list(self.__out)
+            self.__out.clear()
+            self.__out_size = 0
             try:
-                header = b""
-                while len(header) < 4 and self.__alive:
-                    h = await self.__reader.read(4)
-                    if not h:
-                        break
-                    else:
-                        header += h
-
-                int_header = int.from_bytes(header, byteorder='little', signed=True)
-
-                if int_header <= 0:
-                    await asyncio.sleep(0.1)
-                    self.is_disconnected()
-                    if self.__alive:
-                        if header == b"":
-                            await self._tpc_put(None)
-                            self.__alive = False
-                            continue
-                        self.log.error(f"Header: {header}")
-                        await self.kick("Invalid packet - header negative")
-                    continue
+                writer.writelines(frames)
+                await writer.drain()
+            except Exception as e:
+                self.log.debug(f'[TCP] Disconnected: {e}')
+                self.__alive = False
+                self.__out.clear()
+                self.__out_idle.set()
+                return
 
-                if int_header > 100 * MB:
-                    await self.kick("Header size limit exceeded")
-                    self.log.warning("Client sent header of >100MB - "
-                                     "assuming malicious intent and disconnecting the client.")
-                    self.log.error(f"Last recv: {await self.__reader.read(100 * MB)}")
-                    continue
+    async def _flush(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.__out_idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
 
-                data = b""
-                while len(data) < int_header and self.__alive:
-                    buffer = await self.__reader.read(int_header - len(data))
-                    if not buffer:
-                        break
-                    else:
-                        data += buffer
+    async def _hold_writer(self):
+        await self._flush()
+        self.__out_hold = True
 
-                abg = b"ABG:"
-                if len(data) > len(abg) and data.startswith(abg):
-                    data = zlib.decompress(data[len(abg):])
-                    # self.log.debug(f"ABG Packet: {len(data)}")
+    def _release_writer(self):
+        self.__out_hold = False
+        self.__out_event.set()
 
-                if one:
-                    return data
-                await self._tpc_put(data)
+    async def _unpack(self, data):
+        try:
+            return await self._core.compression.unpack(data, 100 * MB)
+        except zlib.error as e:
+            self.log.warning(f"Cannot decompress ABG packet: {e}")
+            await self.kick("Invalid packet - bad ABG data")
+            return None
+
+    def _frame_received(self, frame):
+        if self.__alive:
+            self._tpc_put(bytes(frame))
+
+    async def _frame_error(self, size):
+        if size <= 0:
+            self.log.error(f"Header: {size}")
+            await self.kick("Invalid packet - header negative")
+        else:
+            await self.kick("Header size limit exceeded")
+            self.log.warning(f"Client sent header of {size / MB:.2f}MB - "
+                             "assuming malicious intent and disconnecting the client.")
 
-            except ConnectionError:
+    async def _recv(self, one=False):
+        if one:
+            try:
+                data = await self.__reader.read_frame()
+            except FrameError as e:
+                await self._frame_error(e.size)
+                return None
+            if data is None:
                 self.__alive = False
-                await self._tpc_put(None)
+                return None
+            if isinstance(data, memoryview):  # Frames bigger than the read buffer
+                data = bytes(data)
+            return await self._unpack(data)
+
+        if not self.__alive:
+            return
+        # Frames are handled right in the protocol callback, wait until the connection is done.
+        self.__reader.set_frame_handler(self._frame_received)
+        try:
+            await self.__reader.wait_frames()
+        except FrameError as e:
+            await self._frame_error(e.size)
+        self.__alive = False
+        self._tpc_put(None)
 
     async def _split_load(self, start, end, d_sock, filename, speed_limit=None):
         real_size = end - start
@@ -292,20 +393,24 @@ class Client:
         self.log.debug(f"[{who}] Real size: {real_size / MB}mb; {real_size == end}, {real_size * 2 == end}")
 
         with open(filename, 'rb') as f:
-            f.seek(start)
             total_sent = 0
             start_time = time.monotonic()
             while total_sent < real_size:
-                data = f.read(min(MB, real_size - total_sent))  # read data in chunks of 1MB or less
+                count = min(MB, real_size - total_sent)  # send data in chunks of 1MB or less
+                await self._core.downloads.throttle(count)
                 try:
-                    writer.write(data)
-                    await writer.drain()
-                    # self.log.debug(f"[{who}] Sent {len(data)} bytes.")
-                except ConnectionError:
+                    # os.sendfile() straight from the page cache; asyncio falls back to read/write
+                    # for transports (or platforms) that cannot do it.
+                    sent = await self._loop.sendfile(writer.transport, f, start + total_sent, count)
+                    # self.log.debug(f"[{who}] Sent {sent} bytes.")
+                except (ConnectionError, RuntimeError) as e:
                     self.__alive = False
-                    self.log.debug(f"[{who}] Disconnected.")
+                    self.log.debug(f"[{who}] Disconnected: {e}")
                     break
-                total_sent += len(data)
+                if not sent:
+                    break
+                total_sent += sent
+                self._core.downloads.account(sent)
 
                 # Calculate delay based on speed limit
                 if speed_limit:
@@ -325,44 +430,37 @@ class Client:
             if data.startswith(b"f"):
                 file = data[1:].decode(config.enc)
                 self.log.info(i18n.client_mod_request.format(repr(file)))
-                size = -1
-                for mod in self._core.mods_list:
-                    if type(mod) == int:
-                        continue
-                    if mod.get('path') == file:
-                        size = mod['size']
-                        self.log.debug("File is accept.")
-                        break
+                mod = self._core.mods.get(file)
+                size = mod.size if mod else -1
                 self.log.debug(f"Mode size: {size}")
                 if size == -1:
                     await self._send(b"CO")
                     await self.kick(f"Not allowed mod: " + file)
                     return
                 await self._send(b"AG")
-                t = 0
-                while not self._down_sock[0]:
-                    await asyncio.sleep(0.1)
-                    t += 1
-                    if t > 50:
+                # Mod is sent as raw bytes right after AG: keep packets out of the stream until it is done
+                await self._hold_writer()
+                try:
+                    if not await self._core.tcp.wait_down_rw(self):
+                        self._release_writer()
                         await self.kick("Missing download socket")
                         return
-                if config.Options['use_queue']:
-                    while self._core.lock_upload:
-                        await asyncio.sleep(.2)
-                    self._core.lock_upload = True
-                speed = config.Options["speed_limit"]
-                if speed:
-                    speed = speed / 2
-                half_size = math.floor(size / 2)
-                t = time.monotonic()
-                uploads = [
-                    self._split_load(0, half_size, False, file, speed),
-                    self._split_load(half_size, size, True, file, speed)
-                ]
-                sl0, sl1 = await asyncio.gather(*uploads)
+                    speed = config.Options["speed_limit"]
+                    if speed:
+                        speed = speed / 2
+                    half_size = math.floor(size / 2)
+                    downloads = self._core.downloads
+                    if downloads.full:
+                        self.log.debug(f"Waiting for a download slot; queue: {downloads.queued}")
+                    async with downloads.transfer(self, file):
+                        t = time.monotonic()
+                        sl0, sl1 = await asyncio.gather(
+                            self._split_load(0, half_size, False, file, speed),
+                            self._split_load(half_size, size, True, file, speed)
+                        )
+                finally:
+                    self._release_writer()
                 tr = (time.monotonic() - t) or 0.0001
-                if self._core.lock_upload:
-                    self._core.lock_upload = False
                 msg = i18n.client_mod_sent.format(round(size / MB, 3), math.ceil(size / tr / MB), int(tr))
                 if speed:
                     msg += i18n.client_mod_sent_limit.format(int(speed * 2))
@@ -376,19 +474,8 @@ class Client:
                     self.log.error(i18n.client_mod_sent_error.format(repr(file)))
                     return
             elif data.startswith(b"SR"):
-                path_list = ''
-                size_list = ''
-                for mod in self._core.mods_list:
-                    if type(mod) == int:
-                        continue
-                    path_list += f"{mod['path']};"
-                    size_list += f"{mod['size']};"
-                mod_list = path_list + size_list
-                self.log.debug(f"Mods List: {mod_list}")
-                if len(mod_list) == 0:
-                    await self._send(b"-")
-                else:
-                    await self._send(mod_list)
+                self.log.debug(f"Mods List: {self._core.mods.sr}")
+                await self._send(self._core.mods.sr)
             elif data == b"Done":
                 await self._send(f"M/levels/{config.Game['map']}/info.json")
                 break
@@ -418,54 +505,69 @@ class Client:
 
     async def _spawn_car(self, data):
         car_data = data[2:]
+        json_start = car_data.find("{")
         car_id = next((i for i, car in enumerate(self._cars) if car is None), len(self._cars))
         cars_count = len(self._cars) - self._cars.count(None)
-        if self._unicycle['id'] != -1:
+        if self._unicycle_id != -1:
             cars_count -= 1  # -1 for unicycle
         self.log.debug(f"car_id={car_id}, cars_count={cars_count}")
         car_json = {}
+        config_text = None
         try:
-            car_json = json.loads(car_data[car_data.find("{"):])
+            # Same config - same str and dict for all cars spawned with it
+            config_text, car_json = self._core.vehicles.configs.put(car_data[json_start:])
         except Exception as e:
             self.log.debug(f"Invalid car_json: Error: {e}; Data: {car_data}")
         allow = True
         allow_unicycle = True
         over_spawn = False
-        lua_data = ev.call_lua_event("onVehicleSpawn", self.cid, car_id, car_data[car_data.find("{"):])
+        lua_data = ev.call_lua_event("onVehicleSpawn", self.cid, car_id, car_data[json_start:])
         if 1 in lua_data:
             allow = False
-        event_data = await ev.call_as_events("onCarSpawn", data=car_json, car_id=car_id, player=self)
+        event_json = car_json
+        if config_text is not None and (ev.has_listeners("onCarSpawn") or ev.has_listeners("onCarSpawned")):
+            event_json = json.loads(config_text)  # car_json is shared by all cars with this config
+        event_data = await ev.call_as_events("onCarSpawn", data=event_json, car_id=car_id, player=self)
         for ev_data in event_data:
             self.log.debug(ev_data)
             # TODO: handle event onCarSpawn
             pass
-        pkt = f"Os:{self.roles}:{self.nick}:{self.cid}-{car_id}:{car_data}"
+        header = f"Os:{self.roles}:{self.nick}:{self.cid}-{car_id}:"
+        pkt = header + car_data
         unicycle = car_json.get("jbm") == "unicycle"
         if allow and config.Game['cars'] > cars_count or (unicycle and allow_unicycle) or over_spawn:
             if unicycle:
-                unicycle_id = self._unicycle['id']
+                unicycle_id = self._unicycle_id
                 if unicycle_id != -1:
                     self.log.debug(f"Delete old unicycle: car_id={unicycle_id}")
                     self._cars[unicycle_id] = None
+                    self._core.remove_car(self.cid, unicycle_id)
                     await self._send(f"Od:{self.cid}-{unicycle_id}", to_all=True, to_self=True)
-                self._unicycle = {"id": car_id, "packet": pkt}
+                self._unicycle_id = car_id
                 self.log.debug(f"Unicycle spawn accepted: car_id={car_id}")
             else:
                 self.log.debug(f"Car spawn accepted: car_id={car_id}")
             self._focus_car = car_id
-            self._cars[car_id] = {
-                "packet": pkt,
-                "json": car_json,
-                "json_ok": bool(car_json),
-                "unicycle": unicycle,
-                "over_spawn": (unicycle and allow_unicycle) or over_spawn,
-                "pos": {}
-            }
+            over_spawn = (unicycle and allow_unicycle) or over_spawn
+            if not self.__alive:
+                # Left while the spawn was awaited: the cid is already cleaned up (maybe reused), add nothing
+                if config_text is not None:
+                    self._core.vehicles.configs.release(config_text)
+                return
+            if config_text is None:  # Not JSON: keep the packet as is
+                car = Car(pkt, "", car_json, unicycle, over_spawn, udp_codec.Position())
+            else:
+                car = Car(header + car_data[:json_start], config_text, car_json, unicycle, over_spawn,
+                          udp_codec.Position())
+            self._cars[car_id] = car
+            self._core.vehicles.add((self.cid, car_id), config_text)  # Same step as _cars: no await between
             await self._send(pkt, to_all=True, to_self=True)
             if self.focus_car == -1:
                 self._focus_car = car_id
-            await ev.call_as_events("onCarSpawned", data=car_json, car_id=car_id, player=self)
+            await ev.call_as_events("onCarSpawned", data=event_json, car_id=car_id, player=self)
         else:
+            if config_text is not None:
+                self._core.vehicles.configs.release(config_text)
             await self._send(pkt)
             des = f"Od:{self.cid}-{car_id}"
             await self._send(des)
@@ -484,7 +586,8 @@ class Client:
         if car_id != -1 and self._cars[car_id]:
 
             admin_allow = False  # Delete from admin, for example...
-            event_data = await ev.call_as_events("onCarDelete", data=self._cars[car_id], car_id=car_id, player=self)
+            event_data = await ev.call_as_events("onCarDelete", data=self._cars[car_id].to_dict(), car_id=car_id,
+                                                 player=self)
             for ev_data in event_data:
                 self.log.debug(ev_data)
                 # TODO: handle event onCarDelete
@@ -493,12 +596,14 @@ class Client:
             if cid == self.cid or admin_allow:
                 await self._send(raw_data, to_all=True, to_self=True)
                 car = self._cars[car_id]
-                if car['unicycle']:
+                if car.unicycle:
                     self.log.debug("unicycle found")
-                    unicycle_id = self._unicycle['id']
-                    self._unicycle['id'] = -1
+                    unicycle_id = self._unicycle_id
+                    self._unicycle_id = -1
                     self._cars[unicycle_id] = None
+                    self._core.remove_car(self.cid, unicycle_id)
                 self._cars[car_id] = None
+                self._core.remove_car(self.cid, car_id)
                 await self._send(f"Od:{self.cid}-{car_id}", to_all=True, to_self=True)
                 await ev.call_as_events("onCarDeleted", data=self._cars[car_id], car_id=car_id, player=self)
                 ev.call_lua_event("onVehicleDeleted", self.cid, car_id)
@@ -532,18 +637,17 @@ class Client:
                     pass
 
                 if cid == self.cid or allow or admin_allow:
-                    if car['unicycle']:
-                        unicycle_id = self._unicycle['id']
-                        self._unicycle['id'] = -1
+                    if car.unicycle:
+                        unicycle_id = self._unicycle_id
+                        self._unicycle_id = -1
                         self.log.debug(f"Delete unicycle")
                         await self._send(f"Od:{self.cid}-{unicycle_id}", to_all=True, to_self=True)
                         self._cars[unicycle_id] = None
+                        self._core.remove_car(self.cid, unicycle_id)
                     else:
                         await self._send(raw_data, to_all=True, to_self=False)
-                        if car['json_ok']:
-                            old_car_json = car['json']
-                            old_car_json.update(new_car_json)
-                            car['json'] = old_car_json
+                        if car.json_ok:
+                            car.json = {**car.json, **new_car_json}  # The old one may be shared
                         self.log.debug(f"Updated car: car_id={car_id}")
         else:
             self.log.debug(f"Invalid car: car_id={car_id}")
@@ -628,7 +732,7 @@ class Client:
             for car in client._cars:
                 if not car:
                     continue
-                await self._send(car['packet'])
+                await self._send(car.packet)
 
         self.log.info(i18n.client_sync_time.format(round(time.monotonic() - self._connect_time, 2)))
         self._ready = True
@@ -655,7 +759,7 @@ class Client:
             if event is None:
                 continue
             try:
-                writer = None
+                to_client = None
                 to_all = True
                 to_self = True
                 message = f"{self.nick}: {msg}"
@@ -668,14 +772,15 @@ class Client:
                         to_all = setting.get("to_all", True)
                         to_self = setting.get("to_self", True)
                         to_client = setting.get("to")
-                        if to_client:
-                            writer = to_client._writer
                     case _:
                         self.log.error(f"[onChatReceive] Bad data returned from event: {event}")
 
                 if config.Options['log_chat']:
                     self.log.info(f"[local] {message}" if not to_all else message)
-                await self._send(f"C:{message}", to_all=to_all, to_self=to_self, writer=writer)
+                if to_client and not to_all:
+                    await to_client._send(f"C:{message}")
+                else:
+                    await self._send(f"C:{message}", to_all=to_all, to_self=to_self)
                 need_send = False
             except KeyError:
                 self.log.error(i18n.client_event_invalid_data.format(event))
@@ -687,11 +792,13 @@ class Client:
             await self._send(data, to_all=True)
 
     async def _handle_codes_tcp(self, data):
-        if data is None:
+        if not data:
             self.__alive = False
             return
-        if len(data) == 0:
-            self.__alive = False
+
+        if data[0] in self._relay_codes:
+            # Pure relay: routed on the first byte, the bytes go out as they came
+            await self._send(data, to_all=True, to_self=False)
             return
 
         _bytes = False
@@ -701,10 +808,6 @@ class Client:
             _bytes = True
             self.log.error("UnicodeDecodeError")
 
-        if data[0] in ['V', 'W', 'Y', 'E', 'N']:
-            await self._send(data, to_all=True, to_self=False)
-            return
-
         # Codes: p, Z, X in udp_server.py
         match data[0]:  # At data[0] code
             case "H":  # Map load, client ready
@@ -737,88 +840,115 @@ class Client:
                 self.log.warning(f"TCP Unknown code: {data[0]}; {data}")
 
     async def _handle_codes_udp(self, data):
-        code = data[2:3].decode()
-        data = data[2:].decode()
+        # Bytes all the way: only the JSON of a position is decoded, the datagram is relayed as is
+        code = udp_codec.code(data)
+        payload = data[udp_codec.HEADER:]
         match code:
-            case "p":  # Ping packet
+            case b"p":  # Ping packet
                 ev.call_event("onSentPing", player=self)
                 await self._send(b"p", to_udp=True)
-            case "Z":  # Position packet
-                sub = data.find("{", 1)
-                last_pos = data[sub:]
-                try:
-                    _, car_id = self._get_cid_vid(data)
-                    if self._cars[car_id]:
-                        last_pos = json.loads(last_pos)
-                        self._last_position = last_pos
-                        self._cars[car_id]['pos'] = last_pos
-                        ev.call_event("onChangePosition", data, player=self, pos=last_pos)
-                except Exception as e:
-                    self.log.warning(f"Cannot parse position packet: {e}")
-                    self.log.debug(f"data: '{data}', sub: {sub}")
-                    self.log.debug(f"last_pos ({type(last_pos)}): {last_pos}")
-                await self._send(data, True, False, True)
-            case "X":
-                await self._send(data, True, False, True)
+            case b"Z":  # Position packet
+                car_id = pos = None
+                ids = udp_codec.parse_ids(data)
+                if ids is None:
+                    self.log.debug(f"Invalid packet: Could not parse cid/vid from position packet: {payload!r}")
+                else:
+                    _, car_id, sub = ids
+                    try:
+                        car = self._cars[car_id]
+                        if car:
+                            # The JSON is kept raw and decoded only if someone reads it
+                            position = udp_codec.Position(data[sub:])
+                            pos = udp_codec.parse_pos(data, sub)
+                            if pos is None:  # Unusual layout: let json find it (and complain)
+                                pos = udp_codec.check_pos(json.loads(position.raw.decode())['pos'])
+                            self._last_position = position
+                            car.pos = position
+                            if ev.has_listeners("onChangePosition"):
+                                ev.call_event("onChangePosition", payload.decode(), player=self, pos=position.value)
+                            if pos is not None:  # Out of range: relayed as is, but not indexed
+                                self._core.spatial.update((self.cid, car_id), pos)
+                                self._core.vehicles.update((self.cid, car_id), pos, position.raw)
+                    except Exception as e:
+                        self.log.warning(f"Cannot parse position packet: {e}")
+                        self.log.debug(f"data: {payload!r}, sub: {sub}")
+                await self._send_position(payload, car_id, pos)
+            case b"X":
+                await self._send(payload, True, False, True)
             case _:
-                self.log.warning(f"UDP Unknown code: {code}; {data}")
+                self.log.warning(f"UDP Unknown code: {code}; {payload!r}")
 
     def _tick_pps(self, _):
         self.tcp_pps = self._tpc_count_recv
         self.udp_pps = self._udp_count_recv
         self._tpc_count_recv = 0
         self._udp_count_recv = 0
-        if self.tcp_pps > self._core.target_tps or self.udp_pps > self._core.target_tps:
-            self.log.warning(f"PPS > TPS; PPS: TPC: {self.tcp_pps}, UDP: {self.udp_pps}")
-
-    async def __tick_player_tcp(self, _):
-        try:
-            if self.__queue_tpc.qsize() > 0:
-                packet = await self.__queue_tpc.get()
-                if packet is None:
-                    return await self._remove_me()
-                await self._handle_codes_tcp(packet)
-        except Exception as e:
-            self.log.error(f'[TPC] Error while ticking player:')
-            self.log.exception(e)
-
-    async def __tick_player_udp(self, _):
-        try:
-            if self.__queue_udp.qsize() > 0:
-                packet = await self.__queue_udp.get()
-                await self._handle_codes_udp(packet)
-        except Exception as e:
-            self.log.error(f'[UDP] Error while ticking player:')
-            self.log.exception(e)
+        # Without a batch limit it's one packet per tick, as the ticks used to handle them
+        limit = (config.Options['packets_per_tick'] or 1) * self._core.target_tps
+        if self.tcp_pps > limit or self.udp_pps > limit:
+            self.log.warning(f"PPS > {limit}; PPS: TPC: {self.tcp_pps}, UDP: {self.udp_pps}")
+
+    async def __consume(self, queue, handler, proto):
+        # Packets are handled as they come; packets_per_tick (if set) makes the client wait for the next tick
+        limit = config.Options['packets_per_tick']
+        count = 0
+        while True:
+            packet = await queue.get()
+            if packet is None:
+                return
+            try:
+                await handler(packet)
+            except Exception as e:
+                self.log.error(f'[{proto}] Error while handling packet:')
+                self.log.exception(e)
+            if limit:
+                count += 1
+                if count >= limit:
+                    count = 0
+                    await self._core.next_tick()
+
+    async def __handle_tcp(self, packet):
+        packet = await self._unpack(packet)
+        if packet is None:
+            return
+        await self._handle_codes_tcp(packet)
 
-    async def _tpc_put(self, packet):
+    def _tpc_put(self, packet):
         if packet:
             self._tpc_count_recv += 1
             self._tpc_count_total_recv += 1
             self._tpc_size_total_recv += len(packet)
-        await self.__queue_tpc.put(packet)
+        self.__queue_tpc.put_nowait(packet)
 
-    async def _udp_put(self, packet):
+    def _udp_put_nowait(self, packet):
         self._udp_count_recv += 1
         self._udp_count_total_recv += 1
         self._udp_size_total_recv += len(packet)
-        await self.__queue_udp.put(packet)
+        self._udp_inbox.put_nowait(packet)
+
+    async def _udp_put(self, packet):
+        self._udp_put_nowait(packet)
 
     async def _looper(self):
         ev.call_lua_event("onPlayerConnecting", self.cid)
         self._connect_time = time.monotonic()
         await self._send(f"P{self.cid}")  # Send clientID
         await self._sync_resources()
+        if not self.__alive:
+            return  # Left or was kicked while syncing
         ev.call_lua_event("onPlayerJoining", self.cid)
-        ev.register("serverTick", self.__tick_player_tcp)
-        ev.register("serverTick", self.__tick_player_udp)
+        self.__tasks.append(self._loop.create_task(self.__consume(self.__queue_tpc, self.__handle_tcp, "TPC")))
+        self.__tasks.append(self._loop.create_task(self.__consume(self._udp_inbox, self._handle_codes_udp, "UDP")))
         ev.register("serverTick_1s", self._tick_pps)
         await self._recv()
 
     async def _remove_me(self):
+        if self.__removed:
+            return
+        self.__removed = True
         await asyncio.sleep(0.3)
         self.__alive = False
-        if self._core.clients_by_nick.get(self.nick):
+        if self._core.clients_by_id.get(self.cid) is self:
             for i, car in enumerate(self._cars):
                 if not car:
                     continue
@@ -830,19 +960,20 @@ class Client:
             ev.call_lua_event("onPlayerDisconnect", self.cid)
             ev.call_event("onPlayerDisconnect", player=self)
             await ev.call_async_event("onPlayerDisconnect", player=self)
-            ev.unregister(self.__tick_player_tcp)
-            ev.unregister(self.__tick_player_udp)
             ev.unregister(self._tick_pps)
             gt = round((time.monotonic() - self._connect_time) / 60, 2)
             self.log.info(i18n.client_player_disconnected.format(gt))
-            self._core.clients[self.cid] = None
-            del self._core.clients_by_id[self.cid]
-            del self._core.clients_by_nick[self.nick]
+            self._core.remove_client(self)
         else:
             self.log.debug(f"Removing client; Closing connection...")
-        self.log.debug(f"TPC: Recv: {self._tpc_count_total_recv}; {self._tpc_size_total_recv / KB:.4f}kb; Sent: {self._tpc_count_total_sent}; {self._tpc_size_total_sent / KB:.4f}kb;")
-        self.log.debug(f"UDP: Recv: {self._udp_count_total_recv}; {self._udp_size_total_recv / KB:.4f}kb; Sent: {self._udp_count_total_sent}; {self._udp_size_total_sent / KB:.4f}kb;")
-        await asyncio.sleep(0.001)
+        self.log.debug(f"TPC: Recv: {self._tpc_count_total_recv}; {self._tpc_size_total_recv / KB:.4f}kb; Sent: {self._tpc_count_total_sent}; {self._tpc_size_total_sent / KB:.4f}kb; Dropped: {self._out_dropped}")
+        self.log.debug(f"UDP: Recv: {self._udp_count_total_recv}; {self._udp_size_total_recv / KB:.4f}kb; Sent: {self._udp_count_total_sent}; {self._udp_size_total_sent / KB:.4f}kb; Coalesced: {self._udp_inbox.coalesced}; Dropped: {self._udp_inbox.dropped}")
+        if not await self._flush(1):
+            self.log.debug("Send queue is not flushed.")
+            self.__writer.transport.abort()  # close() would wait for the peer to read it
+        for task in self.__tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
         try:
             self.__writer.close()
             await self.__writer.wait_closed()
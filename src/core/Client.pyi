@@ -5,22 +5,34 @@
 # Licence: FPA
 # (c) kuitoi.su 2023
 import asyncio
-from asyncio import StreamReader, StreamWriter, DatagramTransport, Lock, Queue
+from asyncio import StreamWriter, DatagramTransport, Lock, Queue, Event, Task
+from collections import deque
 from logging import Logger
-from typing import Tuple, List, Dict, Optional, Union, Any
+from typing import Tuple, List, Dict, Optional, Union, Any, Deque, Callable, Awaitable
 
-from core import Core, utils
+from core import Core, utils, udp_codec
+from core.tcp_protocol import FrameProtocol
+from core.udp_inbox import UDPInbox
+from core.vehicles import Car
 
 
 class Client:
 
-    def __init__(self, reader: StreamReader, writer: StreamWriter, core: Core) -> "Client":
+    def __init__(self, reader: FrameProtocol, writer: StreamWriter, core: Core) -> "Client":
         self._connect_time: float = 0.0
         self.__tasks = []
+        self.__removed = False
         self.__reader = reader
         self.__writer = writer
         self.__queue_tpc = Queue()
-        self.__queue_udp = Queue()
+        self._udp_inbox = UDPInbox()
+        self.__out: Deque[bytes] = deque()
+        self.__out_size = 0
+        self.__out_event = Event()
+        self.__out_idle = Event()
+        self.__out_hold = False
+        self.__out_task: Task | None = None
+        self._out_dropped = 0
         self._tpc_count_recv = 0
         self._udp_count_recv = 0
         self._tpc_count_total_recv = 0
@@ -36,7 +48,7 @@ class Client:
         self.tcp_pps = 0
         self.udp_pps = 0
         self._udp_sock: Tuple[DatagramTransport | None, Tuple[str, int] | None] = (None, None)
-        self._down_sock: Tuple[StreamReader | None, StreamWriter | None] = (None, None)
+        self._down_sock: Tuple[FrameProtocol | None, StreamWriter | None] = (None, None)
         self._log = utils.get_logger("client(id: )")
         self._addr: Tuple[str, int] = writer.get_extra_info("sockname")
         self._loop = asyncio.get_event_loop()
@@ -51,9 +63,9 @@ class Client:
         self._ready = False
         self._focus_car = -1
         self._identifiers = []
-        self._cars: List[Union[Dict[str, Union[str, bool, Dict[str, Union[str, List[int], float]]]], None]] = []
-        self._unicycle: Dict[str, Union[int, str]]  = {"id": -1, "packet": ""}
-        self._last_position = {}
+        self._cars: List[Optional[Car]] = []
+        self._unicycle_id: int = -1
+        self._last_position: udp_codec.Position = udp_codec.Position()
         self._lock = Lock()
 
     async def __gracefully_kick(self): ...
@@ -79,7 +91,7 @@ class Client:
     @property
     def identifiers(self) -> list: ...
     @property
-    def cars(self) -> dict: ...
+    def cars(self) -> Dict[int, dict]: ...
     @property
     def focus_car(self):
         return self._focus_car
@@ -89,8 +101,22 @@ class Client:
     async def kick(self, reason: str) -> None: ...
     async def send_message(self, message: str | bytes, to_all: bool = True) -> None:...
     async def send_event(self, event_name: str, event_data: Any, to_all: bool = False) -> None: ...
-    async def _send(self, data: bytes | str, to_all: bool = False, to_self: bool = True, to_udp: bool = False, writer: StreamWriter = None) -> None: ...
+    async def _pack(self, data: bytes) -> bytes: ...
+    @staticmethod
+    def _frame(payload: bytes) -> bytes: ...
+    async def _send(self, data: bytes | str, to_all: bool = False, to_self: bool = True, to_udp: bool = False) -> bool | None: ...
+    async def _send_position(self, data: bytes, car_id: int | None, pos: list | None) -> None: ...
+    def _send_udp(self, payload: bytes) -> None: ...
+    def _write_frame(self, frame: bytes) -> bool: ...
+    def _drop_slow(self) -> None: ...
+    async def __writer_loop(self) -> None: ...
+    async def _flush(self, timeout: float = None) -> bool: ...
+    async def _hold_writer(self) -> None: ...
+    def _release_writer(self) -> None: ...
     async def _sync_resources(self) -> None: ...
+    async def _unpack(self, data: bytes) -> bytes | None: ...
+    def _frame_received(self, frame: memoryview) -> None: ...
+    async def _frame_error(self, size: int) -> None: ...
     async def _recv(self, one=False) -> bytes | None: ...
     async def _split_load(self, start: int, end: int, d_sock: bool, filename: str, sl: float) -> None: ...
     async def _get_cid_vid(self, s: str) -> Tuple[int, int]: ...
@@ -105,9 +131,10 @@ class Client:
     async def _handle_codes_tcp(self, data: bytes) -> None: ...
     async def _handle_codes_udp(self, data: bytes) -> None: ...
     def _tick_pps(self, _): ...
-    async def __tick_player_tcp(self, _): ...
-    async def __tick_player_udp(self, _): ...
-    async def _tpc_put(self, data): ...
+    async def __consume(self, queue: Queue, handler: Callable[[bytes], Awaitable[None]], proto: str) -> None: ...
+    async def __handle_tcp(self, packet: bytes) -> None: ...
+    def _tpc_put(self, data): ...
+    def _udp_put_nowait(self, data): ...
     async def _udp_put(self, data): ...
     async def _looper(self) -> None: ...
     def _update_logger(self) -> None: ...
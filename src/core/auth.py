@@ -0,0 +1,144 @@
+# Developed by KuiToi Dev
+# File core.auth.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import time
+from collections import deque
+
+
+class AuthQueueTimeout(Exception):
+    pass
+
+
+class _Phase:
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=256)
+
+    def add(self, spent):
+        self.count += 1
+        self.total += spent
+        if spent > self.max:
+            self.max = spent
+        self.recent.append(spent)
+
+    def p95(self):
+        if not self.recent:
+            return 0.0
+        recent = sorted(self.recent)
+        return recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+
+
+class AuthPipeline:
+    """
+    Player key -> BeamMP account lookup.
+    At most max_requests lookups hit the auth server at a time; the rest wait in FIFO order
+    up to queue_timeout seconds. Good answers are cached for ttl seconds, so a player
+    reconnecting (e.g. after a server restart) skips the network. Same keys in flight share one request.
+    """
+
+    phases = ("version", "key", "queue", "http", "hooks")
+
+    def __init__(self, http, url, max_requests=8, ttl=300, queue_timeout=10):
+        self.http = http
+        self.url = url
+        self.ttl = ttl
+        self.queue_timeout = queue_timeout
+        self.max_requests = max_requests
+        self._semaphore = asyncio.Semaphore(max_requests)
+        self._cache = {}  # key -> (expires, result)
+        self._inflight = {}  # key -> future
+        self.waiting = 0
+        self.inflight = 0
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.stats = {phase: _Phase() for phase in self.phases}
+
+    def record(self, phase, spent):
+        self.stats[phase].add(spent)
+
+    def _get_cached(self, key):
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        expires, result = cached
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        return result
+
+    async def lookup(self, key):
+        """BeamMP answer for the key: {"username", "roles", "guest", "identifiers"} or {"error": ...}."""
+        result = self._get_cached(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        self.misses += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._request(key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved: waiters (if any) get it
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._inflight[key]
+        return result
+
+    async def _request(self, key):
+        t = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise AuthQueueTimeout(f"No free auth slot in {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+            self.record("queue", time.monotonic() - t)
+        self.inflight += 1
+        try:
+            t = time.monotonic()
+            _, result = await self.http.post_json(self.url, data={'key': key})
+            self.record("http", time.monotonic() - t)
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+        if isinstance(result, dict) and not result.get("error"):
+            self._cache[key] = (time.monotonic() + self.ttl, result)
+        return result
+
+    def _expire(self, _=None):
+        now = time.monotonic()
+        for key in [k for k, (expires, _result) in self._cache.items() if expires < now]:
+            del self._cache[key]
+
+    def parse_console(self, x):
+        if x and x[0] == "reset":
+            self._cache.clear()
+            return "Auth cache cleared."
+        self._expire()
+        out = (f"Auth: in flight {self.inflight}/{self.max_requests}; "
+               f"waiting {self.waiting}; timeouts {self.timeouts}.\n"
+               f"Cache: {len(self._cache)} keys; hits {self.hits}; misses {self.misses}; ttl {self.ttl}s.\n")
+        out += f"{'phase':<9}{'count':>7}{'avg ms':>9}{'p95 ms':>9}{'max ms':>9}\n"
+        for phase, stats in self.stats.items():
+            avg = stats.total / stats.count if stats.count else 0.0
+            out += f"{phase:<9}{stats.count:>7}{avg * 1000:>9.1f}{stats.p95() * 1000:>9.1f}{stats.max * 1000:>9.1f}\n"
+        return out[:-1]
@@ -0,0 +1,50 @@
+# Developed by KuiToi Dev
+# File core.cids.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import heapq
+
+
+class CIDAllocator:
+    """
+    Client IDs: the lowest free id is handed out first (min-heap of free ids), O(log n).
+    reserve() takes an id, commit() marks it as used by a client, release() gives it back;
+    releasing an id twice (or one that was never taken) does nothing.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._free = list(range(size))  # Sorted list is a valid heap
+        self._reserved = set()
+        self._used = set()
+
+    def __len__(self):
+        return len(self._used)
+
+    @property
+    def free(self):
+        return len(self._free)
+
+    def reserve(self):
+        """Lowest free id, or None if all are taken."""
+        if not self._free:
+            return None
+        cid = heapq.heappop(self._free)
+        self._reserved.add(cid)
+        return cid
+
+    def commit(self, cid):
+        self._reserved.remove(cid)
+        self._used.add(cid)
+
+    def release(self, cid):
+        if cid in self._used:
+            self._used.remove(cid)
+        elif cid in self._reserved:
+            self._reserved.remove(cid)
+        else:
+            return False
+        heapq.heappush(self._free, cid)
+        return True
@@ -0,0 +1,157 @@
+# Developed by KuiToi Dev
+# File core.compression.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _CodeStats:
+    __slots__ = ("count", "raw", "packed", "time", "skipped", "skipped_size", "skip", "backoff")
+
+    def __init__(self):
+        self.count = 0  # Compressed packets
+        self.raw = 0
+        self.packed = 0
+        self.time = 0.0
+        self.skipped = 0
+        self.skipped_size = 0
+        self.skip = 0  # Packets left to send raw
+        self.backoff = 0
+
+    @property
+    def ratio(self):
+        return self.packed / self.raw if self.raw else 1.0
+
+
+class CompressionPolicy:
+    """
+    ABG compression of packets.
+    Keeps per packet code statistics; codes whose payloads do not compress are sent raw
+    for a while (exponential backoff) instead of wasting CPU on zlib.
+    Payloads bigger than offload_size are (de)compressed in a thread pool.
+    """
+
+    abg = b"ABG:"
+
+    def __init__(self, level=6, threshold=400, offload_size=256 * 1024, min_gain=0.1, max_skip=256, workers=2):
+        self.level = level
+        self.threshold = threshold
+        self.offload_size = offload_size
+        self.min_gain = min_gain
+        self.max_skip = max_skip
+        self._stats = {}
+        self._workers = workers
+        self._executor = None
+        self.offloaded = 0
+
+    def _get_stats(self, code):
+        stats = self._stats.get(code)
+        if stats is None:
+            stats = self._stats[code] = _CodeStats()
+        return stats
+
+    def _run(self, func, *args):
+        # zlib releases the GIL, so big payloads are (de)compressed in threads and the event loop keeps ticking
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix="codec")
+        self.offloaded += 1
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _skip(self, data):
+        size = len(data)
+        if size <= self.threshold:
+            return True
+        stats = self._get_stats(data[0])
+        if stats.skip > 0:
+            stats.skip -= 1
+            stats.skipped += 1
+            stats.skipped_size += size
+            return True
+        return False
+
+    def _compress(self, data):
+        t = time.perf_counter()
+        packed = zlib.compress(data, self.level)
+        return packed, time.perf_counter() - t
+
+    def _account(self, data, packed, spent):
+        size = len(data)
+        stats = self._get_stats(data[0])
+        stats.time += spent
+        stats.count += 1
+        stats.raw += size
+        packed_size = len(packed) + len(self.abg)
+        if packed_size > size * (1 - self.min_gain):
+            # Not worth it: send raw and stop trying for a while
+            stats.packed += size
+            stats.backoff = min(stats.backoff * 2 or 1, self.max_skip)
+            stats.skip = stats.backoff
+            return data
+        stats.packed += packed_size
+        stats.backoff = 0
+        return self.abg + packed
+
+    def pack(self, data):
+        if self._skip(data):
+            return data
+        return self._account(data, *self._compress(data))
+
+    async def pack_async(self, data):
+        if self._skip(data):
+            return data
+        if len(data) > self.offload_size:
+            return self._account(data, *await self._run(self._compress, data))
+        return self._account(data, *self._compress(data))
+
+    @staticmethod
+    def _decompress(data, max_size):
+        # Bounded: a zip bomb stops at max_size instead of ballooning memory
+        d = zlib.decompressobj()
+        out = d.decompress(data, max_size)
+        if d.unconsumed_tail:
+            raise zlib.error(f"Decompressed data exceeds {max_size} bytes")
+        if not d.eof:
+            raise zlib.error("Incomplete or truncated stream")
+        return out
+
+    async def unpack(self, data, max_size):
+        abg_len = len(self.abg)
+        if len(data) <= abg_len or data[:abg_len] != self.abg:
+            return data
+        data = memoryview(data)[abg_len:]
+        if len(data) > self.offload_size:
+            return await self._run(self._decompress, data, max_size)
+        return self._decompress(data, max_size)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def time_saved(self):
+        saved = 0.0
+        for stats in self._stats.values():
+            if stats.raw:
+                saved += stats.skipped_size * stats.time / stats.raw
+        return saved
+
+    def parse_console(self, x):
+        if x and x[0] == "reset":
+            self._stats.clear()
+            return "Compression stats cleared."
+        out = (f"Compression: level {self.level}; threshold {self.threshold} bytes; "
+               f"offloaded to threads: {self.offloaded}.\n")
+        if not self._stats:
+            return out + "No packets compressed yet."
+        out += f"{'code':<5}{'packets':>9}{'skipped':>9}{'raw kb':>11}{'ratio':>7}{'cpu ms':>9}\n"
+        for code, stats in sorted(self._stats.items()):
+            out += (f"{chr(code):<5}{stats.count:>9}{stats.skipped:>9}{stats.raw / 1024:>11.1f}"
+                    f"{stats.ratio:>7.2f}{stats.time * 1000:>9.1f}\n")
+        skipped = sum(s.skipped_size for s in self._stats.values())
+        out += f"Skipped {skipped / 1024:.1f}kb of incompressible data; CPU time saved: ~{self.time_saved() * 1000:.1f}ms"
+        return out
@@ -7,17 +7,24 @@
 import asyncio
 import math
 import os
-import random
 import statistics
 import time
 from collections import deque
 
-import aiohttp
-
 from core import utils, __version__
 from core.Client import Client
+from core.auth import AuthPipeline
+from core.cids import CIDAllocator
+from core.compression import CompressionPolicy
+from core.culling import Culling, create_culling
+from core.downloads import DownloadScheduler
+from core.http_client import HTTPClient
+from core.lod import LODRelay
+from core.mods import ModManifest
+from core.spatial import SpatialGrid
 from core.tcp_server import TCPServer
 from core.udp_server import UDPServer
+from core.vehicles import VehicleTable
 from modules import PluginsLoader, PermsSystem
 
 
@@ -44,8 +51,10 @@ class Core:
         self.clients = []
         self.clients_by_id = {}
         self.clients_by_nick = {}
+        self.cids = CIDAllocator(0)
         self.mods_dir = "./mods"
-        self.mods_list = [0, ]
+        self.mods = ModManifest(self.mods_dir)
+        self._mods_task = None
         self.server_ip = config.Server["server_ip"]
         self.server_port = config.Server["server_port"]
         self.tcp = TCPServer
@@ -55,15 +64,41 @@ class Core:
         self.udp_pps = 0
 
         self.tps = 60
+        self._next_tick = None
         self.target_tps = 60
 
-        self.lock_upload = False
+        self.http = HTTPClient(config.Options['http_timeout'], config.Options['http_hedge_delay'],
+                               config.Options['http_max_requests'])
+        self.auth = AuthPipeline(self.http, config.Options['auth_url'], config.Options['auth_max_requests'],
+                                 config.Options['auth_cache_ttl'], config.Options['auth_queue_timeout'])
+        self.downloads = DownloadScheduler(1 if config.Options['use_queue'] else config.Options['max_downloads'],
+                                           config.Options['server_speed_limit'])
+        self.compression = CompressionPolicy(config.Options['compress_level'], config.Options['compress_threshold'],
+                                             config.Options['codec_offload_size'] * KB)
+        self.spatial = SpatialGrid(config.Options['spatial_cell'])
+        self.culling = Culling()
+        self.set_culling(config.Options['culling'])
+        self.lod = LODRelay(config.Options['lod_near'], config.Options['lod_far'])
+        self.lod.index = self.spatial
+        self.vehicles = VehicleTable()
 
         self.client_major_version = "2.0"
         self.BeamMP_version = "3.4.1"  # 16.07.2024
 
         ev.register("_get_BeamMP_version", lambda x: tuple([int(i) for i in self.BeamMP_version.split(".")]))
         ev.register("_get_player", lambda x: self.get_client(**x['kwargs']))
+        ev.register("_set_culling", lambda x: self._plugin_call(self.set_culling, x))
+        ev.register("_cars_near", lambda x: self._plugin_call(self.cars_near, x))
+        ev.register("_nearest_cars", lambda x: self._plugin_call(self.nearest_cars, x))
+        ev.register("_vehicle_states", lambda x: self._plugin_call(self.vehicles.column, x))
+
+    @staticmethod
+    def _plugin_call(func, x):
+        # ev.call_event() only logs a handler's error: return it, the plugin API raises it to the caller
+        try:
+            return func(*x['args'], **x['kwargs'])
+        except Exception as e:
+            return e
 
     def get_client(self, cid=None, nick=None, raw=False):
         if raw:
@@ -78,26 +113,74 @@ class Core:
             return self.clients_by_nick.get(nick)
 
     async def insert_client(self, client):
-        await asyncio.sleep(random.randint(3, 9) * 0.01)
-        cid = 0
-        for _client in self.clients:
-            if not _client:
-                break
-            if _client.cid == cid:
-                cid += 1
-            else:
-                break
-        await asyncio.sleep(random.randint(3, 9) * 0.01)
-        if not self.clients[cid]:
-            client._cid = cid
-            self.clients_by_nick.update({client.nick: client})
-            self.log.debug(f"Inserting client: {client.nick}:{client.cid}")
-            self.clients_by_id.update({client.cid: client})
-            self.clients[client.cid] = client
-            # noinspection PyProtectedMember
-            client._update_logger()
-            return
-        await self.insert_client(client)
+        cid = self.cids.reserve()
+        if cid is None:
+            return False
+        client._cid = cid
+        self.log.debug(f"Inserting client: {client.nick}:{client.cid}")
+        self.clients_by_nick.update({client.nick: client})
+        self.clients_by_id.update({client.cid: client})
+        self.clients[client.cid] = client
+        self.cids.commit(cid)
+        # noinspection PyProtectedMember
+        client._update_logger()
+        return True
+
+    def remove_client(self, client):
+        cid = client.cid
+        if not self.cids.release(cid):
+            return False
+        self.clients[cid] = None
+        self.clients_by_id.pop(cid, None)
+        self.culling.forget(cid)
+        self.lod.forget(cid)
+        self.spatial.remove_cid(cid)
+        self.vehicles.remove_cid(cid)
+        self.tcp.drop_orphan(cid)
+        if self.clients_by_nick.get(client.nick) is client:
+            del self.clients_by_nick[client.nick]
+        return True
+
+    def remove_car(self, cid, car_id):
+        self.spatial.remove((cid, car_id))
+        self.vehicles.remove((cid, car_id))
+
+    def set_culling(self, policy, **kwargs):
+        """Position packets culling: policy name ("none", "radius", "grid") or a Culling instance."""
+        if isinstance(policy, str):
+            if policy != "none":
+                kwargs.setdefault("far_rate", config.Options['culling_far_rate'])
+                kwargs.setdefault("cell" if policy == "grid" else "radius", config.Options['culling_radius'])
+            policy = create_culling(policy, **kwargs)
+        elif not isinstance(policy, Culling):
+            raise TypeError("policy must be str or Culling")
+        policy.index = self.spatial
+        self.culling = policy
+        self.log.debug(f"Culling: {policy.name} ({policy.describe()})")
+        return policy
+
+    def _cars_list(self, found):
+        out = []
+        for distance, (cid, car_id) in found:
+            client = self.clients_by_id.get(cid)
+            if client:
+                out.append((client, car_id, distance))
+        return out
+
+    def cars_near(self, pos, radius):
+        """[(client, car_id, distance)] of the cars within radius of pos [x, y, z], nearest first."""
+        return self._cars_list(self.spatial.query_radius(pos, radius))
+
+    def nearest_cars(self, pos, count=1, radius=None):
+        """[(client, car_id, distance)] of the count nearest cars to pos [x, y, z]."""
+        return self._cars_list(self.spatial.nearest(pos, count, radius))
+
+    def next_tick(self):
+        """Future resolved at the end of the current server tick."""
+        if self._next_tick is None:
+            self._next_tick = asyncio.get_running_loop().create_future()
+        # Shared by all waiters: a cancelled waiter must not cancel it for the rest
+        return asyncio.shield(self._next_tick)
 
     def create_client(self, *args, **kwargs):
         self.log.debug(f"Create client")
@@ -155,6 +238,22 @@ class Core:
                 continue
             await client._remove_me()
 
+    async def _refresh_mods(self, _):
+        # Hashing new mods can take longer than a tick: run aside, one refresh at a time
+        if self._mods_task is None or self._mods_task.done():
+            self._mods_task = asyncio.create_task(self.__refresh_mods())
+
+    async def __refresh_mods(self):
+        try:
+            added, removed = await self.mods.refresh(settle=True)
+        except Exception as e:
+            self.log.error("Error in _refresh_mods.")
+            self.log.exception(e)
+            return
+        if added or removed:
+            self.log.debug(f"Mods changed: {added=}; {removed=}")
+            self.log.info(i18n.core_mods_loaded.format(len(self.mods), round(self.mods.total_size / MB, 2)))
+
     # noinspection SpellCheckingInspection,PyPep8Naming
     async def heartbeat(self, test=False):
         try:
@@ -165,19 +264,13 @@ class Core:
                 self.direct = True
                 return
 
-            BEAM_backend = ["backend.beammp.com", "backup1.beammp.com", "backup2.beammp.com"]
+            BEAM_backend = [url.rstrip("/") + "/heartbeat" for url in config.Options['backend_urls']]
             _map = config.Game['map'] if "/" in config.Game['map'] else f"/levels/{config.Game['map']}/info.json"
             tags = config.Server['tags'].replace(", ", ";").replace(",", ";")
             self.log.debug(f"[heartbeat] {_map=}")
             self.log.debug(f"[heartbeat] {tags=}")
             if tags and tags[-1:] != ";":
                 tags += ";"
-            modlist = "".join(f"/{os.path.basename(mod['path'])};" for mod in self.mods_list[1:])
-            modstotalsize = self.mods_list[0]
-            modstotal = len(self.mods_list) - 1
-            self.log.debug(f"[heartbeat] {modlist=}")
-            self.log.debug(f"[heartbeat] {modstotalsize=}")
-            self.log.debug(f"[heartbeat] {modstotal=}")
             while self.run:
                 playerslist = "".join(f"{client.nick};" for client in self.clients if client and client.alive)
                 data = {
@@ -192,28 +285,19 @@ class Core:
                     "name": config.Server["name"],
                     "tags": tags,
                     "guests": not config.Auth["private"],
-                    "modlist": modlist,
-                    "modstotalsize": modstotalsize,
-                    "modstotal": modstotal,
+                    "modlist": self.mods.modlist,
+                    "modstotalsize": self.mods.total_size,
+                    "modstotal": len(self.mods),
                     "playerslist": playerslist,
                     "desc": config.Server['description'],
                     "pass": False
                 }
 
                 body = {}
-                for server_url in BEAM_backend:
-                    url = "https://" + server_url + "/heartbeat"
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.post(url, data=data, headers={"api-v": "2"}) as response:
-                                code = response.status
-                                # text = await response.text()
-                                # self.log.debug(f"[HB] res={text}")
-                                body = await response.json()
-                        break
-                    except Exception as e:
-                        self.log.debug(f"Auth: Error `{e}` while auth with `{server_url}`")
-                        continue
+                try:
+                    _, code, body = await self.http.hedged(BEAM_backend, data=data, headers={"api-v": "2"})
+                except Exception as e:
+                    self.log.debug(f"Auth: Error `{e}` while auth with backend")
 
                 if body:
                     if not (body.get("status") is not None and
@@ -334,6 +418,9 @@ class Core:
 
                 ev.call_event("serverTick")
                 await ev.call_async_event("serverTick")
+                if self._next_tick is not None:
+                    self._next_tick.set_result(None)
+                    self._next_tick = None
 
                 # Calculate the time taken for this tick
                 end_time = time.monotonic()
@@ -391,6 +478,18 @@ class Core:
                                                     "  <white>></white> <b><skyblue>kick admin bad boy</skyblue></b>\n"
                                                     "  <white>></white> <b><skyblue>kick :0 bad boy</skyblue></b>",
                             "kick user", {"kick": "<playerlist>"})
+        console.add_command("compression", self.compression.parse_console, None, "ABG compression stats",
+                            {"compression": {"reset": None}})
+        console.add_command("downloads", self.downloads.parse_console, None, "Mod downloads queue")
+        console.add_command("mods", self.mods.parse_console, None, "Mods list")
+        console.add_command("auth", self.auth.parse_console, None, "Players auth stats",
+                            {"auth": {"reset": None}})
+        console.add_command("udp", self.udp.parse_console, None, "UDP batching stats")
+        console.add_command("culling", lambda x: self.culling.parse_console(x), None, "Position packets culling",
+                            {"culling": {"reset": None}})
+        console.add_command("spatial", self.spatial.parse_console, None, "Cars spatial index")
+        console.add_command("vehicles", self.vehicles.parse_console, None, "Vehicle table and configs")
+        console.add_command("lod", self.lod.parse_console, None, "Position packets LOD stats", {"lod": {"reset": None}})
         ev.register("onChatReceive", self._parse_chat)
 
         pl_dir = "plugins"
@@ -407,26 +506,23 @@ class Core:
         try:
             # Mods handler
             self.log.debug("Listing mods..")
-            if not os.path.exists(self.mods_dir):
-                os.mkdir(self.mods_dir)
-            for file in os.listdir(self.mods_dir):
-                path = os.path.join(self.mods_dir, file).replace("\\", "/")
-                if os.path.isfile(path) and path.endswith(".zip"):
-                    size = os.path.getsize(path)
-                    self.mods_list.append({"path": path, "size": size})
-                    self.mods_list[0] += size
-            self.log.debug(f"mods_list: {self.mods_list}")
-            len_mods = len(self.mods_list) - 1
-            if len_mods > 0:
-                self.log.info(i18n.core_mods_loaded.format(len_mods, round(self.mods_list[0] / MB, 2)))
+            await self.mods.refresh()
+            self.log.debug(f"mods: {self.mods.entries}")
+            if len(self.mods) > 0:
+                self.log.info(i18n.core_mods_loaded.format(len(self.mods), round(self.mods.total_size / MB, 2)))
             self.log.info(i18n.init_ok)
 
             await self.heartbeat(True)  # Check
 
             self.clients = [None] * config.Game["players"] * 4  # * 4 For down sock and buffer.
+            self.cids = CIDAllocator(len(self.clients))
             tasks = []
             ev.register("serverTick_1s", self._check_alive)
             ev.register("serverTick_1s", self._send_online)
+            ev.register("serverTick_5s", self._refresh_mods)
+            ev.register("serverTick_60s", self.auth._expire)
+            if self.lod.enabled:
+                ev.register("serverTick", self.lod.flush)
             # ev.register("serverTick_5s", self.heartbeat)
             f_tasks = [self.tcp.start, self.udp._start, console.start, self._tick, self.heartbeat]
             if config.RCON['enabled']:
@@ -466,6 +562,10 @@ class Core:
             await self.__gracefully_remove()
             self.tcp.stop()
             self.udp._stop()
+            self.compression.shutdown()
+            if self._mods_task is not None:
+                self._mods_task.cancel()
+            await self.http.close()
             await ev.call_async_event("_plugins_unload")
             if config.Options['use_lua']:
                 await ev.call_async_event("_lua_plugins_unload")
@@ -7,12 +7,22 @@
 import asyncio
 import time
 from threading import Thread
-from typing import Callable, List, Dict
+from typing import Any, Callable, List, Dict
 
 from core import utils
 from .Client import Client
+from .auth import AuthPipeline
+from .cids import CIDAllocator
+from .compression import CompressionPolicy
+from .culling import Culling
+from .downloads import DownloadScheduler
+from .http_client import HTTPClient
+from .lod import LODRelay
+from .mods import ModManifest
+from .spatial import SpatialGrid
 from .tcp_server import TCPServer
 from .udp_server import UDPServer
+from .vehicles import VehicleTable
 
 
 class Core:
@@ -28,20 +38,36 @@ class Core:
         self.clients: List[Client | None]= []
         self.clients_by_id: Dict[{int: Client}]= {}
         self.clients_by_nick: Dict[{str: Client}] = {}
+        self.cids = CIDAllocator(0)
         self.clients_counter: int = 0
         self.mods_dir: str = "mods"
-        self.mods_list: list = []
+        self.mods = ModManifest()
         self.server_ip = config.Server["server_ip"]
         self.server_port = config.Server["server_port"]
         self.tcp = TCPServer
         self.udp = UDPServer
         self.web_thread: Thread = None
         self.web_stop: Callable = lambda: None
-        self.lock_upload = False
+        self.http = HTTPClient()
+        self.auth = AuthPipeline(self.http, '')
+        self.downloads = DownloadScheduler()
+        self.compression = CompressionPolicy()
+        self.spatial = SpatialGrid()
+        self.culling = Culling()
+        self.lod = LODRelay()
+        self.vehicles = VehicleTable()
         self.client_major_version = "2.0"
         self.BeamMP_version = "3.4.1"
+    @staticmethod
+    def _plugin_call(func, x: dict) -> Any: ...
     def get_client(self, cid=None, nick=None) -> Client | None: ...
-    async def insert_client(self, client: Client) -> None: ...
+    async def insert_client(self, client: Client) -> bool: ...
+    def remove_client(self, client: Client) -> bool: ...
+    def remove_car(self, cid: int, car_id: int) -> None: ...
+    def set_culling(self, policy: str | Culling, **kwargs) -> Culling: ...
+    def cars_near(self, pos: list, radius: float) -> List[tuple[Client, int, float]]: ...
+    def nearest_cars(self, pos: list, count: int = 1, radius: float = None) -> List[tuple[Client, int, float]]: ...
+    def next_tick(self) -> asyncio.Future: ...
     def create_client(self, *args, **kwargs) -> Client: ...
     def get_clients_list(self, need_cid=False) -> str: ...
     async def _check_alive(self) -> None: ...
@@ -52,6 +78,8 @@ class Core:
     def _get_color_tps(self, ticks, d): ...
     async def _cmd_tps(self, ticks_2s, ticks_5s, ticks_30s, ticks_60s) -> str: ...
     def _tick(self) -> None: ...
+    async def _refresh_mods(self, _) -> None: ...
+    async def __refresh_mods(self) -> None: ...
     async def heartbeat(self, test=False) -> None: ...
     async def _cmd_kick(self, args: list) -> None | str: ...
     async def _parse_chat(self, event): ...
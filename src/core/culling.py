@@ -0,0 +1,124 @@
+# Developed by KuiToi Dev
+# File core.culling.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import math
+from abc import ABCMeta, abstractmethod
+
+
+class Culling:
+    """
+    Interest management for position (Z) packets: rate() says which part of a car's position packets
+    a receiver gets - 1 is every packet, 0.25 every 4th, 0 none.
+    This base class is the "none" policy; subclass it and override rate() for your own.
+    """
+
+    name = "none"
+    index = None  # SpatialGrid of all cars, set by Core.set_culling()
+
+    def __init__(self):
+        self.sent = 0
+        self.culled = 0
+        self._counters = {}  # (cid, car_id, receiver cid) -> packets seen
+
+    def rate(self, pos, receiver):
+        return 1.0
+
+    def allow(self, client, car_id, pos, receiver):
+        """Should this position packet of client's car go to receiver."""
+        rate = self.rate(pos, receiver)
+        if rate >= 1:
+            self.sent += 1
+            return True
+        if rate > 0:
+            key = (client.cid, car_id, receiver.cid)
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+            if count % round(1 / rate) == 0:
+                self.sent += 1
+                return True
+        self.culled += 1
+        return False
+
+    def forget(self, cid):
+        for key in [k for k in self._counters if k[0] == cid or k[2] == cid]:
+            del self._counters[key]
+
+    def describe(self):
+        return "no culling"
+
+    def parse_console(self, x):
+        if x and x[0] == "reset":
+            self.sent = self.culled = 0
+            return "Culling stats reset."
+        total = self.sent + self.culled
+        culled = self.culled / total * 100 if total else 0.0
+        return (f"Culling: {self.name} ({self.describe()}).\n"
+                f"Position packets: sent {self.sent}; culled {self.culled} ({culled:.1f}%).")
+
+
+class _NearCulling(Culling, metaclass=ABCMeta):
+    """Full rate for receivers with a car near the sender's one, far_rate for the rest; subclasses define near()."""
+
+    def __init__(self, far_rate=0.0):
+        super().__init__()
+        self.far_rate = far_rate
+        self._pos = None
+        self._near = ()
+
+    @abstractmethod
+    def near(self, pos):
+        """cids of the players that have a car near pos."""
+
+    def rate(self, pos, receiver):
+        if pos is not self._pos:  # Same packet for all receivers: ask the index once
+            self._pos = pos
+            self._near = self.near(pos)
+        if receiver.cid in self._near or not self.index.has_cid(receiver.cid):
+            return 1.0  # Near, or nothing to measure from (spectator)
+        return self.far_rate
+
+
+class RadiusCulling(_NearCulling):
+    """Full rate within radius of any of the receiver's cars, far_rate beyond it."""
+
+    name = "radius"
+
+    def __init__(self, radius=500, far_rate=0.0):
+        super().__init__(far_rate)
+        self.radius = radius
+
+    def near(self, pos):
+        return {key[0] for _, key in self.index.query_radius(pos, self.radius)}
+
+    def describe(self):
+        return f"radius {self.radius}m; far rate {self.far_rate}"
+
+
+class GridCulling(_NearCulling):
+    """Map is split into cell x cell squares (x, y); full rate in the receiver's cells and their neighbours."""
+
+    name = "grid"
+
+    def __init__(self, cell=500, far_rate=0.0):
+        super().__init__(far_rate)
+        self.cell = cell
+
+    def near(self, pos):
+        cell = self.cell
+        x, y = math.floor(pos[0] / cell) * cell, math.floor(pos[1] / cell) * cell
+        return {key[0] for key in self.index.query_box(x - cell, y - cell, x + 2 * cell, y + 2 * cell)}
+
+    def describe(self):
+        return f"cell {self.cell}m; far rate {self.far_rate}"
+
+
+policies = {"none": Culling, "radius": RadiusCulling, "grid": GridCulling}
+
+
+def create_culling(name, **kwargs):
+    if name not in policies:
+        raise ValueError(f"Unknown culling policy: {name}; known: {', '.join(policies)}")
+    return policies[name](**kwargs)
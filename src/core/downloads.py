@@ -0,0 +1,112 @@
+# Developed by KuiToi Dev
+# File core.downloads.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class DownloadScheduler:
+    """
+    Mod downloads of all clients.
+    Admission is FIFO: at most max_active transfers run, the rest wait on futures.
+    Server bandwidth is capped by a token bucket; chunks reserve tokens in arrival order,
+    so concurrent transfers share the bandwidth round-robin, chunk by chunk.
+    """
+
+    def __init__(self, max_active=0, rate=0):
+        self.max_active = max_active  # 0 - unlimited
+        self.rate = rate * MB  # bytes/s; 0 - unlimited
+        self._burst = max(self.rate, MB)
+        self._tokens = self._burst
+        self._last = time.monotonic()
+        self._waiters = deque()
+        self.active = {}  # client -> file
+        self.sent = 0
+        self.transfers = 0
+        self._samples = deque([(self._last, 0)], maxlen=10)
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    @property
+    def full(self):
+        return bool(self._waiters) or not self._free()
+
+    def _free(self):
+        return not self.max_active or len(self.active) < self.max_active
+
+    async def _acquire(self, client, file):
+        if not self._waiters and self._free():
+            self.active[client] = file
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us right before the cancel: pass it on
+                self._release(waiter)
+            elif waiter in self._waiters:  # _wakeup() may have dropped it already
+                self._waiters.remove(waiter)
+            raise
+        del self.active[waiter]
+        self.active[client] = file
+
+    def _release(self, client):
+        self.active.pop(client, None)
+        self._wakeup()
+
+    def _wakeup(self):
+        while self._waiters and self._free():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot over; it stays taken until the waiter runs
+                self.active[waiter] = None
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def transfer(self, client, file):
+        await self._acquire(client, file)
+        self.transfers += 1
+        try:
+            yield
+        finally:
+            self._release(client)
+
+    async def throttle(self, size):
+        """Reserve size bytes of server bandwidth; sleeps until the reservation is covered."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self.rate) - size
+        self._last = now
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def account(self, size):
+        self.sent += size
+        now = time.monotonic()
+        if now - self._samples[-1][0] >= 1:
+            self._samples.append((now, self.sent))
+
+    def throughput(self):
+        t, sent = self._samples[0]
+        elapsed = time.monotonic() - t
+        return (self.sent - sent) / elapsed if elapsed > 0 else 0.0
+
+    def parse_console(self, _):
+        limit = f"{self.rate / MB:g}MB/s" if self.rate else "unlimited"
+        slots = self.max_active or "unlimited"
+        out = (f"Downloads: active {len(self.active)}/{slots}; queued {self.queued}; speed limit: {limit}.\n"
+               f"Throughput: {self.throughput() / MB:.2f}MB/s; sent {self.sent / MB:.1f}MB in {self.transfers} transfers.")
+        for client, file in self.active.items():
+            if file is not None:
+                out += f"\n  {client.nick}: {file}"
+        return out
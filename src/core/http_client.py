@@ -0,0 +1,103 @@
+# Developed by KuiToi Dev
+# File core.http_client.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import time
+
+import aiohttp
+
+from core import utils
+
+
+class HTTPClient:
+    """
+    One pooled aiohttp session for the BeamMP backend (auth, heartbeat).
+    Connections are kept alive between requests; every request has a timeout and
+    at most max_requests run at a time. hedged() sends the request to a backup host when
+    the previous one has not answered within hedge_delay, the first good answer wins.
+    """
+
+    def __init__(self, timeout=10, hedge_delay=2, max_requests=16, keepalive=60):
+        self.log = utils.get_logger("HTTPClient")
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.max_requests = max_requests
+        self.keepalive = keepalive
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_requests)
+        self.requests = 0
+        self.failed = 0
+        self.hedges = 0
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_requests, keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def post_json(self, url, data=None, headers=None, timeout=None):
+        """POST form data, returns (status, json body)."""
+        session = self._get_session()
+        kwargs = {} if timeout is None else {"timeout": aiohttp.ClientTimeout(total=timeout)}
+        async with self._semaphore:
+            self.requests += 1
+            try:
+                async with session.post(url, data=data, headers=headers, **kwargs) as response:
+                    return response.status, await response.json(content_type=None)
+            except Exception:
+                self.failed += 1
+                raise
+
+    async def hedged(self, urls, data=None, headers=None, timeout=None):
+        """
+        POST to urls[0]; every hedge_delay (or on error) the next url joins the race.
+        Returns (url, status, body) of the first answer with a json object; raises the last error if none did.
+        """
+        loop = asyncio.get_running_loop()
+        pending = {}
+        urls = iter(urls)
+        error = None
+        t = time.monotonic()
+
+        def launch():
+            url = next(urls, None)
+            if url is None:
+                return False
+            pending[loop.create_task(self.post_json(url, data, headers, timeout))] = url
+            return True
+
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedges += 1
+                    continue
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        status, body = task.result()
+                    except Exception as e:
+                        self.log.debug(f"{url}: {e!r}")
+                        error = e
+                        launch()
+                        continue
+                    if isinstance(body, dict):
+                        self.log.debug(f"{url}: {status} in {time.monotonic() - t:.3f}s")
+                        return url, status, body
+                    error = ValueError(f"{url}: unexpected answer: {body!r}")
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error or ValueError("No urls")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,109 @@
+# Developed by KuiToi Dev
+# File core.lod.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import time
+
+
+class _Tier:
+    __slots__ = ("packets", "sent", "sent_bytes", "replaced", "saved_bytes")
+
+    def __init__(self):
+        self.packets = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.replaced = 0
+        self.saved_bytes = 0
+
+
+class LODRelay:
+    """
+    Level of detail for position (Z) packets, per receiver: cars within near meters of any of the
+    receiver's cars go at full rate, within far at 1/2, the rest at 1/4.
+    Between sends only the latest packet of a (car, receiver) pair is kept; a held packet
+    goes out anyway once the car has been silent for hold seconds, so the last position is never lost.
+    """
+
+    rates = (1, 2, 4)
+    names = ("near", "mid", "far")
+    index = None  # SpatialGrid of all cars, set by Core
+
+    def __init__(self, near=0, far=0, hold=0.2):
+        self.near = near
+        self.far = max(far, near)
+        self.hold = hold
+        self.clock = time.monotonic
+        self._pending = {}  # (cid, car_id, receiver cid) -> (payload, receiver, tier, count, time); oldest first
+        self._pos = None
+        self._distances = {}
+        self.stats = [_Tier() for _ in self.rates]
+
+    @property
+    def enabled(self):
+        return self.near > 0
+
+    def tier(self, pos, receiver):
+        if pos is not self._pos:  # Same packet for all receivers: ask the index once
+            self._pos = pos
+            self._distances = distances = {}
+            for distance, (cid, _) in reversed(self.index.query_radius(pos, self.far)):
+                distances[cid] = distance
+        distance = self._distances.get(receiver.cid)
+        if distance is None:
+            return 2 if self.index.has_cid(receiver.cid) else 0  # No cars (spectator): full rate
+        return 0 if distance <= self.near else 1
+
+    def _send(self, receiver, payload, tier):
+        stats = self.stats[tier]
+        stats.sent += 1
+        stats.sent_bytes += len(payload)
+        receiver._send_udp(payload)
+
+    def relay(self, client, car_id, pos, payload, receiver):
+        tier = self.tier(pos, receiver)
+        self.stats[tier].packets += 1
+        key = (client.cid, car_id, receiver.cid)
+        held = self._pending.pop(key, None)
+        count = 1
+        if held is not None:
+            stats = self.stats[held[2]]
+            stats.replaced += 1
+            stats.saved_bytes += len(held[0])
+            count = held[3] + 1
+        if count >= self.rates[tier]:
+            self._send(receiver, payload, tier)
+        else:
+            self._pending[key] = (payload, receiver, tier, count, self.clock())
+
+    def flush(self, _=None):
+        pending = self._pending
+        deadline = self.clock() - self.hold
+        while pending:
+            key = next(iter(pending))
+            payload, receiver, tier, _, held_at = pending[key]
+            if held_at > deadline:
+                break
+            del pending[key]
+            self._send(receiver, payload, tier)
+
+    def forget(self, cid):
+        for key in [k for k in self._pending if k[0] == cid or k[2] == cid]:
+            del self._pending[key]
+
+    def parse_console(self, x):
+        if x and x[0] == "reset":
+            self.stats = [_Tier() for _ in self.rates]
+            return "LOD stats reset."
+        if not self.enabled:
+            return "LOD: off."
+        out = f"LOD: near {self.near}m; far {self.far}m; held {len(self._pending)}.\n"
+        out += f"{'tier':<6}{'rate':>6}{'packets':>10}{'sent':>10}{'sent KB':>10}{'saved':>10}{'saved KB':>10}\n"
+        for name, rate, stats in zip(self.names, self.rates, self.stats):
+            out += (f"{name:<6}{'1/' + str(rate):>6}{stats.packets:>10}{stats.sent:>10}{stats.sent_bytes / KB:>10.1f}"
+                    f"{stats.replaced:>10}{stats.saved_bytes / KB:>10.1f}\n")
+        saved = sum(s.saved_bytes for s in self.stats)
+        total = saved + sum(s.sent_bytes for s in self.stats)
+        out += f"Saved {saved / KB:.1f} KB of {total / KB:.1f} KB ({saved / total * 100 if total else 0:.1f}%)."
+        return out
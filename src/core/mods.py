@@ -0,0 +1,169 @@
+# Developed by KuiToi Dev
+# File core.mods.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from core import utils
+
+
+def _hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _scan(mods_dir):
+    files = {}
+    with os.scandir(mods_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".zip") and entry.is_file():
+                stat = entry.stat()
+                path = os.path.join(mods_dir, entry.name).replace("\\", "/")
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class ModEntry:
+    __slots__ = ("path", "name", "size", "mtime", "hash")
+
+    def __init__(self, path, size, mtime, hash=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self.mtime = mtime
+        self.hash = hash
+
+    def __repr__(self):
+        return f"ModEntry(path={self.path!r}, size={self.size}, hash={self.hash!r})"
+
+
+class ModManifest:
+    """
+    Mods of the server: path -> ModEntry, plus the SR response and heartbeat mod list built once per change.
+    Hashes (sha256) are computed in a thread pool and cached in mods_dir/.hashes.json by (size, mtime),
+    so unchanged mods are not read again on restart. refresh() only rehashes new or changed files.
+    """
+
+    cache_name = ".hashes.json"
+
+    def __init__(self, mods_dir="./mods", workers=None):
+        self.log = utils.get_logger("mods")
+        self.mods_dir = mods_dir
+        self.cache_path = os.path.join(mods_dir, self.cache_name)
+        self.entries = {}
+        self.total_size = 0
+        self.sr = b"-"
+        self.modlist = ""
+        self._workers = workers
+        self._pending = {}  # path -> (size, mtime) of new/changed files not taken yet
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        cache = {e.name: [e.size, e.mtime, e.hash] for e in self.entries.values() if e.hash}
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            self.log.warning(f"Cannot save mods cache: {e}")
+
+    def _build(self):
+        entries = self.entries.values()
+        self.total_size = sum(e.size for e in entries)
+        if entries:
+            # BeamMP: "path1;path2;...size1;size2;..."
+            self.sr = ("".join(f"{e.path};" for e in entries) + "".join(f"{e.size};" for e in entries)).encode()
+        else:
+            self.sr = b"-"
+        self.modlist = "".join(f"/{e.name};" for e in entries)
+
+    async def _hash(self, entries):
+        # Hashing hundreds of MB is CPU bound, but hashlib releases the GIL on big chunks: threads run it in
+        # parallel without a process pool, whose workers would re-import (and so boot) the server on spawn platforms
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(min(self._workers or os.cpu_count() or 1, len(entries)))
+        try:
+            hashes = await asyncio.gather(*(loop.run_in_executor(executor, _hash_file, e.path) for e in entries),
+                                          return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False)
+        for entry, result in zip(entries, hashes):
+            if isinstance(result, Exception):
+                self.log.warning(f"Cannot hash {entry.path!r}: {result}")
+            else:
+                entry.hash = result
+
+    async def refresh(self, settle=False):
+        """
+        Sync with mods_dir; returns (added, removed) paths.
+        With settle, a new or changed file is taken only once its size and mtime hold still between two refreshes,
+        so a mod that is still being copied isn't hashed and sent half-written.
+        """
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            if not os.path.exists(self.mods_dir):
+                os.mkdir(self.mods_dir)
+            files = await loop.run_in_executor(None, _scan, self.mods_dir)
+            first = not self.entries
+            cache = await loop.run_in_executor(None, self._load_cache) if first else {}
+            removed = [path for path in self.entries if path not in files]
+            added = []
+            pending = {}
+            for path in removed:
+                del self.entries[path]
+            for path, (size, mtime) in files.items():
+                entry = self.entries.get(path)
+                if entry and entry.size == size and entry.mtime == mtime:
+                    continue
+                if settle and self._pending.get(path) != (size, mtime):
+                    pending[path] = (size, mtime)
+                    continue
+                entry = ModEntry(path, size, mtime)
+                cached = cache.get(entry.name)
+                if cached and cached[0] == size and cached[1] == mtime:
+                    entry.hash = cached[2]
+                self.entries[path] = entry
+                added.append(entry)
+            self._pending = pending
+            if not added and not removed:
+                return [], []
+            self._build()
+            unhashed = [e for e in added if e.hash is None]
+            if unhashed:
+                self.log.debug(f"Hashing {len(unhashed)} mods..")
+                await self._hash(unhashed)
+            if unhashed or removed:
+                await loop.run_in_executor(None, self._save_cache)
+            return [e.path for e in added], removed
+
+    def parse_console(self, x):
+        if not self.entries:
+            return "No mods loaded."
+        out = f"Mods: {len(self.entries)}; {self.total_size / MB:.2f}MB\n"
+        for e in self.entries.values():
+            out += f"  {e.path} {e.size / MB:.2f}MB sha256:{e.hash or '-'}\n"
+        return out[:-1]
@@ -0,0 +1,174 @@
+# Developed by KuiToi Dev
+# File core.spatial.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import heapq
+import math
+from itertools import groupby
+
+
+class SpatialGrid:
+    """
+    Positions of all cars, bucketed into cell x cell squares on the map plane (x, y).
+    Keys are (cid, car_id); distances are full 3D. update()/remove() are O(1),
+    queries look only at the cells that can hold an answer.
+    """
+
+    max_coord = 1e6  # update() ignores positions out of it, they'd make every query walk an empty map
+
+    def __init__(self, cell=100):
+        self.cell = cell
+        self._cells = {}  # (cx, cy) -> {key: (x, y, z)}
+        self._items = {}  # key -> (cx, cy)
+        self._by_cid = {}  # cid -> {car_id}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell), math.floor(y / self.cell)
+
+    def get(self, key):
+        cell = self._items.get(key)
+        if cell is None:
+            return None
+        return self._cells[cell][key]
+
+    def has_cid(self, cid):
+        return cid in self._by_cid
+
+    def update(self, key, pos):
+        """Move key to pos; False (and nothing changes) if pos isn't finite or is out of max_coord."""
+        x, y, z = float(pos[0]), float(pos[1]), float(pos[2])
+        limit = self.max_coord
+        if not (abs(x) <= limit and abs(y) <= limit and abs(z) <= limit):  # nan compares False
+            return False
+        cell = self._cell(x, y)
+        old = self._items.get(key)
+        if old != cell:
+            if old is not None:
+                self._discard(old, key)
+            else:
+                self._by_cid.setdefault(key[0], set()).add(key[1])
+            self._items[key] = cell
+        bucket = self._cells.get(cell)
+        if bucket is None:
+            bucket = self._cells[cell] = {}
+        bucket[key] = (x, y, z)
+        return True
+
+    def _discard(self, cell, key):
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+
+    def remove(self, key):
+        cell = self._items.pop(key, None)
+        if cell is None:
+            return False
+        self._discard(cell, key)
+        cars = self._by_cid[key[0]]
+        cars.discard(key[1])
+        if not cars:
+            del self._by_cid[key[0]]
+        return True
+
+    def remove_cid(self, cid):
+        for car_id in list(self._by_cid.get(cid, ())):
+            self.remove((cid, car_id))
+
+    def _ring(self, cx, cy, r):
+        # Cells at Chebyshev distance r from (cx, cy)
+        if r == 0:
+            yield cx, cy
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield x, cy - r
+            yield x, cy + r
+        for y in range(cy - r + 1, cy + r):
+            yield cx - r, y
+            yield cx + r, y
+
+    def _rings(self, cx, cy, max_r):
+        # (r, occupied cells of ring r) outwards from (cx, cy). Rings are walked while they hold fewer cells
+        # than are occupied; farther out (a lone car far away) the occupied cells are sorted by ring instead
+        cells = self._cells
+        r = 0
+        while r <= max_r and (2 * r + 1) ** 2 <= len(cells):
+            yield r, [c for c in self._ring(cx, cy, r) if c in cells]
+            r += 1
+        if r > max_r:
+            return
+        rest = sorted((max(abs(c[0] - cx), abs(c[1] - cy)), c) for c in cells)
+        rest = [(d, c) for d, c in rest if r <= d <= max_r]
+        for d, group in groupby(rest, key=lambda item: item[0]):
+            yield d, [c for _, c in group]
+
+    def query_box(self, x0, y0, x1, y1):
+        """Keys with x0 <= x < x1 and y0 <= y < y1."""
+        out = []
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        cells = self._cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            candidates = [(c, bucket) for c, bucket in cells.items() if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            candidates = [(c, cells[c]) for c in ((x, y) for x in range(cx0, cx1 + 1) for y in range(cy0, cy1 + 1))
+                          if c in cells]
+        for _, bucket in candidates:
+            for key, (x, y, _z) in bucket.items():
+                if x0 <= x < x1 and y0 <= y < y1:
+                    out.append(key)
+        return out
+
+    def query_radius(self, pos, radius):
+        """[(distance, key)] within radius of pos, nearest first."""
+        px, py, pz = pos[0], pos[1], pos[2]
+        r2 = radius * radius
+        out = []
+        for key in self.query_box(px - radius, py - radius, px + radius, py + radius):
+            x, y, z = self.get(key)
+            d2 = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+            if d2 <= r2:
+                out.append((math.sqrt(d2), key))
+        out.sort()
+        return out
+
+    def nearest(self, pos, k=1, radius=None):
+        """[(distance, key)] of the k nearest cars (optionally within radius), nearest first."""
+        if k <= 0 or not self._items:
+            return []
+        px, py, pz = pos[0], pos[1], pos[2]
+        cx, cy = self._cell(px, py)
+        cell = self.cell
+        cells = self._cells
+        # Rings past the farthest occupied cell can't add anything
+        max_r = max(max(abs(c[0] - cx), abs(c[1] - cy)) for c in cells)
+        if radius is not None:
+            max_r = min(max_r, int(radius // cell) + 1)
+        best = []  # max-heap of (-d2, key)
+        for r, ring in self._rings(cx, cy, max_r):
+            if len(best) == k and (r - 1) * cell > math.sqrt(-best[0][0]):
+                break  # Everything in ring r is at least (r - 1) * cell away
+            for c in ring:
+                for key, (x, y, z) in cells[c].items():
+                    d2 = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+                    if radius is not None and d2 > radius * radius:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, key))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, key))
+        return sorted((math.sqrt(-d2), key) for d2, key in best)
+
+    def parse_console(self, x):
+        cars = len(self._items)
+        per_cell = cars / len(self._cells) if self._cells else 0.0
+        return (f"Spatial index: {cars} cars of {len(self._by_cid)} players; cell {self.cell}m; "
+                f"{len(self._cells)} cells in use; {per_cell:.1f} cars per cell.")
@@ -0,0 +1,245 @@
+# Developed by KuiToi Dev
+# File core.tcp_protocol.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import struct
+from asyncio.streams import FlowControlMixin
+from collections import deque
+
+# TNetwork.cpp; Line: 383
+# BeamMP TCP protocol sends a header of 4 bytes, followed by the data.
+# [][][][][][]...[]
+# ^------^^---...-^
+#  size     data
+_header = struct.Struct("<i")
+
+
+class FrameError(Exception):
+
+    def __init__(self, size):
+        super().__init__(f"Invalid frame header: {size}")
+        self.size = size
+
+
+class FrameProtocol(FlowControlMixin, asyncio.BufferedProtocol):
+    """
+    Game connection protocol. Data is received straight into a preallocated buffer
+    and BeamMP frames are split in place; frames are handed out as memoryview slices.
+    Before start_framing() the connection is read as raw bytes (code, cid, etc.).
+    """
+
+    def __init__(self, client_connected_cb, buffer_size=64 * 1024, max_frame=100 * 1024 * 1024, loop=None):
+        super().__init__(loop=loop)
+        self._client_connected_cb = client_connected_cb
+        self._task = None
+        self.transport = None
+        self.writer = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._max_frame = max_frame
+        self._framing = False
+        self._large = None  # [bytearray, size] for frames bigger than the buffer; grows as data arrives
+        self._frames = deque()
+        self._handler = None
+        self._waiter = None
+        self._eof = False
+        self._stopped = False  # stop_frames(): the owner doesn't want anything more
+        self._exception = None
+        self._reading_paused = False
+        self._closed = self._loop.create_future()
+        self._done = self._loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.writer = asyncio.StreamWriter(transport, self, None, self._loop)
+        if self._client_connected_cb is not None:
+            self._task = self._loop.create_task(self._client_connected_cb(self, self.writer))
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self._eof = True
+        self._wakeup()
+        if not self._done.done():
+            self._done.set_result(None)
+        if not self._closed.done():
+            self._closed.set_result(None)
+        self._handler = None
+        self._task = None
+
+    def eof_received(self):
+        self._eof = True
+        self._wakeup()
+        return None
+
+    def _get_close_waiter(self, stream):
+        return self._closed
+
+    def get_buffer(self, sizehint):
+        if self._large is not None:
+            # Read through the (empty) buffer: the frame storage only grows by what was actually received
+            buffer, size = self._large
+            return self._view[:min(size - len(buffer), len(self._view))]
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buffer):
+            self._compact()
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        if self._large is not None:
+            buffer, size = self._large
+            buffer += self._view[:nbytes]
+            if len(buffer) == size:
+                self._large = None
+                self._deliver(memoryview(buffer), True)
+            return
+        self._end += nbytes
+        if self._framing:
+            self._parse()
+        else:
+            self._wakeup()
+            if self._start == 0 and self._end == len(self._buffer):
+                self._pause_reading()
+
+    def _compact(self):
+        size = self._end - self._start
+        self._buffer[:size] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = size
+
+    def _parse(self):
+        buffer_size = len(self._buffer)
+        while True:
+            available = self._end - self._start
+            if available < 4:
+                break
+            size = _header.unpack_from(self._buffer, self._start)[0]
+            if size <= 0 or size > self._max_frame:
+                self._set_exception(FrameError(size))
+                return
+            if available - 4 >= size:
+                start = self._start + 4
+                self._start = start + size
+                self._deliver(self._view[start:start + size], False)
+                if self._exception is not None:
+                    return
+                continue
+            if size + 4 > buffer_size:
+                # Frame is bigger than the buffer: collect it in its own storage. It isn't allocated
+                # for the size from the header, a peer that never sends the data must not cost memory
+                self._large = [bytearray(self._view[self._start + 4:self._end]), size]
+                self._start = self._end = 0
+            elif self._start + 4 + size > buffer_size:
+                self._compact()
+            break
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _deliver(self, frame, owned):
+        if self._stopped:
+            return
+        if self._handler is not None:
+            self._handler(frame)
+            return
+        self._frames.append(frame if owned else bytes(frame))
+        self._wakeup()
+
+    def _set_exception(self, exc):
+        self._exception = exc
+        self._pause_reading()
+        if not self._done.done():
+            self._done.set_exception(exc)
+            self._done.exception()  # Mark as retrieved; the owner awaits wait_frames() if it cares
+        self._wakeup()
+
+    def _pause_reading(self):
+        if not self._reading_paused and self.transport is not None and not self.transport.is_closing():
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def _resume_reading(self):
+        if self._reading_paused and self.transport is not None and not self.transport.is_closing():
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _wait(self):
+        self._waiter = self._loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    async def read(self, n=-1):
+        """Raw read of up to n bytes; used before framing starts."""
+        while self._start == self._end and not self._eof:
+            await self._wait()
+        if n < 0:
+            n = self._end - self._start
+        n = min(n, self._end - self._start)
+        data = bytes(self._view[self._start:self._start + n])
+        self._start += n
+        self._resume_reading()
+        return data
+
+    def set_max_frame(self, size):
+        """Largest frame accepted from now on; a bigger header fails with FrameError."""
+        self._max_frame = size
+
+    def start_framing(self):
+        if self._framing:
+            return
+        self._framing = True
+        self._parse()
+        if self._exception is None:
+            self._resume_reading()
+
+    async def read_frame(self):
+        """Next frame as bytes-like object; None on EOF. Raises FrameError on a bad header."""
+        self.start_framing()
+        while not self._frames:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof or self._stopped:
+                return None
+            await self._wait()
+        return self._frames.popleft()
+
+    def set_frame_handler(self, handler):
+        """
+        handler(frame: memoryview) is called for every frame in the protocol callback.
+        The view is valid only until the handler returns.
+        """
+        self.start_framing()
+        self._handler = handler
+        while self._frames and self._handler is not None:
+            handler(memoryview(self._frames.popleft()))
+        self._parse()
+
+    def stop_frames(self):
+        """No more frames: reading stops, queued frames are dropped, read_frame()/wait_frames() return."""
+        self._stopped = True
+        self._handler = None
+        self._frames.clear()
+        self._pause_reading()
+        if not self._done.done():
+            self._done.set_result(None)
+        self._wakeup()
+
+    async def wait_frames(self):
+        """Wait until the connection is done; raises FrameError on a bad header."""
+        await self._done
+
+    def at_eof(self):
+        return self._eof and self._start == self._end and not self._frames
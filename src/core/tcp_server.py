@@ -5,11 +5,12 @@
 # Licence: FPA
 # (c) kuitoi.su 2023
 import asyncio
+import time
 import traceback
 
-import aiohttp
-
 from core import utils
+from core.auth import AuthQueueTimeout
+from core.tcp_protocol import FrameProtocol
 from modules import RateLimiter
 
 
@@ -23,6 +24,9 @@ class TCPServer:
         self.port = port
         self.run = False
         self._connections = set()
+        self._down_waiters = {}  # cid -> future; resolved when the 'D' connection arrives
+        self._down_orphans = {}  # cid -> TimerHandle; closes a download socket nobody asked for
+        self.down_timeout = 5
         self.server = None
         self.rl = RateLimiter(50, 10, 300)
         console.add_command("rl", self.rl.parse_console, None, "RateLimiter menu",
@@ -30,27 +34,35 @@ class TCPServer:
 
     async def auth_client(self, reader, writer):
         client = self.Core.create_client(reader, writer)
+        auth = self.Core.auth
         self.log.info(i18n.core_identifying_connection)
+        t = time.monotonic()
         data = await client._recv(True)
         self.log.debug(f"Version: {data}")
+        if data is None:  # Left, or kicked for a bad frame
+            return False, client
         if data.decode("utf-8") != f"VC{self.Core.client_major_version}":
             await client.kick(i18n.core_player_kick_outdated)
             return False, client
         else:
             await client._send(b"A")  # Accepted client version
+        auth.record("version", time.monotonic() - t)
 
+        t = time.monotonic()
         data = await client._recv(True)
         self.log.debug(f"Key: {data}")
+        if data is None:
+            return False, client
         if not data or len(data) > 50:
             await client.kick(i18n.core_player_kick_bad_key)
             return False, client
         client._key = data.decode("utf-8")
+        auth.record("key", time.monotonic() - t)
+        t = time.monotonic()
         ev.call_event("onPlayerSentKey", player=client)
+        hooks_time = time.monotonic() - t
         try:
-            async with aiohttp.ClientSession() as session:
-                url = 'https://auth.beammp.com/pkToUser'
-                async with session.post(url, data={'key': client._key}) as response:
-                    res = await response.json()
+            res = await auth.lookup(client._key)
             self.log.debug(f"res: {res}")
             if res.get("error"):
                 await client.kick(i18n.core_player_kick_invalid_key)
@@ -66,6 +78,10 @@ class TCPServer:
                 client._identifiers["ip"] = client._addr[0]
             # noinspection PyProtectedMember
             client._update_logger()
+        except AuthQueueTimeout as e:
+            self.log.warning(f"Auth: {e}")
+            await client.kick(i18n.core_player_kick_auth_busy)
+            return False, client
         except Exception as e:
             self.log.error("Auth error.")
             self.log.exception(e)
@@ -81,6 +97,7 @@ class TCPServer:
         allow = True
         reason = i18n.core_player_kick_no_allowed_default_reason
 
+        t = time.monotonic()
         lua_data = ev.call_lua_event("onPlayerAuth", client.nick, client.roles, client.guest, client.identifiers)
         for data in lua_data:
             if 1 == data:
@@ -94,6 +111,7 @@ class TCPServer:
 
         ev.call_event("onPlayerAuthenticated", player=client)
         await ev.call_async_event("onPlayerAuthenticated", player=client)
+        auth.record("hooks", hooks_time + time.monotonic() - t)
         if not client.alive:
             await client.kick("Not accepted.")
             return False, client
@@ -101,9 +119,11 @@ class TCPServer:
         if len(self.Core.clients_by_id) > config.Game["players"]:
             await client.kick(i18n.core_player_kick_server_full)
             return False, client
-        else:
-            await self.Core.insert_client(client)
-            client.log.info(i18n.core_identifying_okay)
+        if not await self.Core.insert_client(client):
+            await client.kick(i18n.core_player_kick_server_full)
+            return False, client
+        client.log.info(i18n.core_identifying_okay)
+        reader.set_max_frame(100 * MB)
 
         return True, client
 
@@ -112,14 +132,55 @@ class TCPServer:
             cid = (await reader.read(1))[0]
             client = self.Core.get_client(cid=cid)
             if client:
+                _, old_writer = client._down_sock
+                if old_writer and old_writer is not writer:
+                    old_writer.close()
                 client._down_sock = (reader, writer)
                 self.log.debug(f"Client: {client.nick}:{cid} - HandleDownload!")
+                waiter = self._down_waiters.pop(cid, None)
+                if waiter and not waiter.done():
+                    waiter.set_result(None)
+                else:
+                    self.drop_orphan(cid)
+                    self._down_orphans[cid] = self.loop.call_later(self.down_timeout, self._close_orphan, client, writer)
             else:
                 writer.close()
                 self.log.debug(f"Unknown client <nick>:{cid} - HandleDownload")
         finally:
             return
 
+    def drop_orphan(self, cid):
+        """Cancel the close timer of cid's unused download socket (the client took it or left)."""
+        handle = self._down_orphans.pop(cid, None)
+        if handle:
+            handle.cancel()
+
+    def _close_orphan(self, client, writer):
+        self._down_orphans.pop(client.cid, None)
+        if client._down_sock[1] is writer:
+            client._down_sock = (None, None)
+        writer.close()
+        self.log.debug(f"Client: {client.nick}:{client.cid} - Download socket was not used; closed.")
+
+    async def wait_down_rw(self, client):
+        """Wait for the download socket of the client; False on timeout."""
+        cid = client.cid
+        self.drop_orphan(cid)
+        _, writer = client._down_sock
+        if writer and not writer.is_closing():
+            return True
+        waiter = self._down_waiters.get(cid)
+        if waiter is None or waiter.done():
+            waiter = self._down_waiters[cid] = self.loop.create_future()
+        try:
+            await asyncio.wait_for(waiter, self.down_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if self._down_waiters.get(cid) is waiter:
+                del self._down_waiters[cid]
+
     async def handle_code(self, code, reader, writer):
         match code:
             case "C":
@@ -139,6 +200,10 @@ class TCPServer:
                 writer.close()
         return False, None
 
+    def _protocol_factory(self):
+        # Until auth_client() is done only the version and key frames come, both tiny
+        return FrameProtocol(self.handle_client, max_frame=4 * KB)
+
     async def handle_client(self, reader, writer):
         while self.run:
             self._connections.add(writer)
@@ -170,8 +235,8 @@ class TCPServer:
         self.log.debug("Starting TCP server.")
         self.run = True
         try:
-            self.server = await asyncio.start_server(self.handle_client, self.host, self.port,
-                                                     backlog=int(config.Game["players"] * 4))
+            self.server = await self.loop.create_server(self._protocol_factory, self.host, self.port,
+                                                        backlog=int(config.Game["players"] * 4))
             self.log.debug(f"TCP server started on {self.server.sockets[0].getsockname()!r}")
             while True:
                 async with self.server:
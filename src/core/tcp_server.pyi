@@ -5,11 +5,12 @@
 # Licence: FPA
 # (c) kuitoi.su 2023
 import asyncio
-from asyncio import StreamWriter, StreamReader
-from typing import Tuple
+from asyncio import StreamWriter
+from typing import Tuple, Dict
 
 from core import utils, Core
 from core.Client import Client
+from core.tcp_protocol import FrameProtocol
 from modules import RateLimiter
 
 
@@ -22,13 +23,20 @@ class TCPServer:
         self.host = host
         self.port = port
         self._connections = set()
+        self._down_waiters: Dict[int, asyncio.Future] = {}
+        self._down_orphans: Dict[int, asyncio.TimerHandle] = {}
+        self.down_timeout = 5
         self.run = False
         self.rl = RateLimiter(50, 10, 15)
 
-    async def auth_client(self, reader: StreamReader, writer: StreamWriter) -> Tuple[bool, Client]: ...
-    async def set_down_rw(self, reader: StreamReader, writer: StreamWriter) -> bool: ...
-    async def handle_code(self, code: str, reader: StreamReader, writer: StreamWriter) -> Tuple[bool, Client]: ...
-    async def handle_client(self, reader: StreamReader, writer: StreamWriter) -> None: ...
+    def _protocol_factory(self) -> FrameProtocol: ...
+    async def auth_client(self, reader: FrameProtocol, writer: StreamWriter) -> Tuple[bool, Client]: ...
+    async def set_down_rw(self, reader: FrameProtocol, writer: StreamWriter) -> bool: ...
+    def drop_orphan(self, cid: int) -> None: ...
+    def _close_orphan(self, client: Client, writer: StreamWriter) -> None: ...
+    async def wait_down_rw(self, client: Client) -> bool: ...
+    async def handle_code(self, code: str, reader: FrameProtocol, writer: StreamWriter) -> Tuple[bool, Client]: ...
+    async def handle_client(self, reader: FrameProtocol, writer: StreamWriter) -> None: ...
     async def start(self) -> None: ...
     async def stop(self) -> None: ...
 
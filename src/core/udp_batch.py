@@ -0,0 +1,171 @@
+# Developed by KuiToi Dev
+# File core.udp_batch.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import struct
+import sys
+from array import array
+
+MSG_DONTWAIT = 0x40
+MSG_TRUNC = 0x20
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+_sockaddr_in = struct.Struct("=HH4s8x")
+_sockaddr_in6 = struct.Struct("=HH4s16sI")
+_NAME_SIZE = 128  # sizeof(struct sockaddr_storage)
+
+
+def _load_libc(name):
+    if not sys.platform.startswith("linux") or ctypes.sizeof(ctypes.c_void_p) != 8:
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        return getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+
+
+def _load_recvmmsg():
+    recvmmsg = _load_libc("recvmmsg")
+    if recvmmsg is not None:
+        recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+def _parse_sockaddr(raw):
+    if struct.unpack_from("=H", raw)[0] == socket.AF_INET6:
+        _, port, flowinfo, host, scope_id = _sockaddr_in6.unpack(raw)
+        return socket.inet_ntop(socket.AF_INET6, host), socket.ntohs(port), \
+            struct.unpack("!I", flowinfo)[0], scope_id
+    _, port, host = _sockaddr_in.unpack(raw)
+    return socket.inet_ntoa(host), socket.ntohs(port)
+
+
+class UDPBatchReader:
+    """
+    Replaces the transport's own reader: every time the socket is readable up to max_batch
+    datagrams are taken with one recvmmsg() call into a preallocated buffer pool and handed
+    to protocol.datagram_received() in one pass. Burst sizes are counted in power-of-two buckets.
+    """
+
+    def __init__(self, transport, protocol, recvmmsg, max_batch=64, slot_size=16 * 1024):
+        self.transport = transport
+        self.protocol = protocol
+        self._recvmmsg = recvmmsg
+        self._fd = None
+        self._loop = asyncio.get_running_loop()
+        self.max_batch = max_batch
+        self.slot_size = slot_size
+        self._msgs = (_MMsgHdr * max_batch)()
+        self._iov = (_IOVec * max_batch)()
+        self._pool = (ctypes.c_char * (max_batch * slot_size))()
+        self._names = (ctypes.c_char * (max_batch * _NAME_SIZE))()
+        pool, names = ctypes.addressof(self._pool), ctypes.addressof(self._names)
+        iov = ctypes.cast(self._iov, ctypes.POINTER(_IOVec))
+        for i in range(max_batch):
+            self._iov[i].iov_base = pool + i * slot_size
+            self._iov[i].iov_len = slot_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = names + i * _NAME_SIZE
+        self._pool_view = memoryview(self._pool).cast("B")
+        self._names_view = memoryview(self._names).cast("B")
+        # msg_namelen, msg_flags and msg_len columns as 4-byte words
+        words = memoryview(self._msgs).cast("B").cast("I")
+        step = ctypes.sizeof(_MMsgHdr) // 4
+        self._namelens = words[_MsgHdr.msg_namelen.offset // 4::step]
+        self._flags = words[_MsgHdr.msg_flags.offset // 4::step]
+        self._lens = words[_MMsgHdr.msg_len.offset // 4::step]
+        self._namelens_reset = array("I", [_NAME_SIZE] * max_batch)
+        self._msgs_addr = ctypes.addressof(self._msgs)
+        self._addrs = {}  # raw sockaddr -> addr tuple
+        self.bursts = 0
+        self.received = 0
+        self.max_burst = 0
+        self.truncated = 0
+        self.errors = 0
+        self.last_error = None
+        self.histogram = [0] * max_batch.bit_length()  # [1], [2-3], [4-7], ...
+
+    def start(self):
+        # The loop doesn't let two readers share the transport's fd: read a duplicate of it
+        self.transport.pause_reading()
+        self._fd = os.dup(self.transport.get_extra_info("socket").fileno())
+        self._loop.add_reader(self._fd, self._read_ready)
+
+    def close(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_ready(self):
+        # One recvmmsg() per wakeup: a flood can't starve the rest of the loop
+        self._namelens[:] = self._namelens_reset
+        while True:
+            count = self._recvmmsg(self._fd, self._msgs_addr, self.max_batch, MSG_DONTWAIT, None)
+            if count > 0:
+                self._dispatch(count)
+                return
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if count < 0 and err not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.errors += 1
+                self.last_error = errno.errorcode.get(err, err)
+            return
+
+    def _dispatch(self, count):
+        self.bursts += 1
+        self.received += count
+        if count > self.max_burst:
+            self.max_burst = count
+        self.histogram[count.bit_length() - 1] += 1
+        pool, raw_names, addrs = self._pool_view, self._names_view, self._addrs
+        slot, received = self.slot_size, self.protocol.datagram_received
+        for i, (size, namelen, flags) in enumerate(zip(self._lens[:count].tolist(), self._namelens[:count].tolist(),
+                                                       self._flags[:count].tolist())):
+            if flags & MSG_TRUNC:
+                self.truncated += 1
+                continue
+            name = bytes(raw_names[i * _NAME_SIZE:i * _NAME_SIZE + namelen])
+            addr = addrs.get(name)
+            if addr is None:
+                if len(addrs) > 4096:
+                    addrs.clear()
+                addr = addrs[name] = _parse_sockaddr(name)
+            received(bytes(pool[i * slot:i * slot + size]), addr)
+
+
+def create_reader(transport, protocol, max_batch):
+    """UDPBatchReader for the transport, or None where recvmmsg() is not available."""
+    recvmmsg = _load_recvmmsg()
+    if recvmmsg is None or transport.get_extra_info("socket") is None or not hasattr(transport, "pause_reading"):
+        return None
+    return UDPBatchReader(transport, protocol, recvmmsg, max_batch)
+
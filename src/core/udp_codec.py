@@ -0,0 +1,92 @@
+# Developed by KuiToi Dev
+# File core.udp_codec.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import json
+from collections.abc import Mapping
+
+# Client UDP datagram: <cid + 1>:<code>...
+# Position: <cid + 1>:Zp:<cid>-<vid>:{json}
+HEADER = 2  # Bytes before the code; packet[HEADER:] is what gets relayed
+
+
+def code(packet):
+    return packet[HEADER:HEADER + 1]
+
+
+def parse_ids(packet):
+    """(cid, vid, json start) of a position packet, or None if the header is broken."""
+    start = packet.find(b":", HEADER + 1) + 1
+    end = packet.find(b":", start) if start else -1
+    if end == -1:
+        return None
+    cid, sep, vid = packet[start:end].partition(b"-")
+    if not (sep and cid.isdigit() and vid.isdigit()):
+        return None
+    return int(cid), int(vid), end + 1
+
+
+_POS = b'"pos":['
+MAX_COORD = 1e6  # Far beyond any map; a coordinate past it (or inf/nan) is garbage from the client
+
+
+def check_pos(pos):
+    """pos as [x, y, z] floats, or None if it isn't three finite numbers within MAX_COORD."""
+    try:
+        x, y, z = float(pos[0]), float(pos[1]), float(pos[2])
+    except (TypeError, ValueError, LookupError):
+        return None
+    if abs(x) <= MAX_COORD and abs(y) <= MAX_COORD and abs(z) <= MAX_COORD:  # False for nan
+        return [x, y, z]
+    return None
+
+
+def parse_pos(packet, start=0):
+    """
+    [x, y, z] of a position packet read straight from the bytes,
+    or None if the JSON isn't laid out as usual or the position is out of range (see check_pos).
+    """
+    begin = packet.find(_POS, start)
+    if begin == -1:
+        return None
+    begin += len(_POS)
+    coords = packet[begin:packet.find(b"]", begin)].split(b",")
+    if len(coords) != 3:
+        return None
+    return check_pos(coords)
+
+
+class Position(Mapping):
+    """
+    Position JSON of a car as a read-only dict, decoded on first access. Broken JSON reads as {}.
+    Core only: plugins get the decoded dict (value).
+    """
+
+    __slots__ = ("raw", "_value")
+
+    def __init__(self, raw=b"{}"):
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            try:
+                self._value = json.loads(self.raw.decode())  # str is faster for json than bytes
+            except ValueError:
+                self._value = {}
+        return self._value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
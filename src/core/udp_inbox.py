@@ -0,0 +1,89 @@
+# Developed by KuiToi Dev
+# File core.udp_inbox.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import asyncio
+from collections import deque
+from itertools import count
+
+from core import udp_codec
+
+
+class UDPInbox:
+    """
+    Player's inbound UDP queue (same put_nowait()/get() as asyncio.Queue).
+    Position (Z) packets are a last-value cache: a newer packet of the same car replaces the queued
+    one in its place, so the queue holds at most one position per car however far handling falls behind.
+    Pings (p) and everything else (X, ..., positions with a broken header) have their own bounded FIFO lanes;
+    overflow drops the oldest.
+    Pings go first, the other two lanes keep arrival order between each other.
+    None closes the inbox: get() returns None once the queued packets are taken.
+    """
+
+    def __init__(self, max_pings=8, max_other=256):
+        self._positions = {}  # header (b"<cid>:Zp:<cid>-<vid>:") -> [seq, packet]; oldest first
+        self._pings = deque()
+        self._other = deque()  # (seq, packet)
+        self.max_pings = max_pings
+        self.max_other = max_other
+        self._seq = count()
+        self._waiter = None
+        self._closed = False
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._positions) + len(self._pings) + len(self._other)
+
+    def put_nowait(self, packet):
+        if packet is None:
+            self._closed = True
+        else:
+            code = udp_codec.code(packet)
+            ids = udp_codec.parse_ids(packet) if code == b"Z" else None
+            if ids is not None:
+                key = packet[:ids[2]]
+                queued = self._positions.get(key)
+                if queued is not None:
+                    queued[1] = packet
+                    self.coalesced += 1
+                    return
+                self._positions[key] = [next(self._seq), packet]
+            elif code == b"p":
+                if len(self._pings) >= self.max_pings:
+                    self._pings.popleft()
+                    self.dropped += 1
+                self._pings.append(packet)
+            else:
+                if len(self._other) >= self.max_other:
+                    self._other.popleft()
+                    self.dropped += 1
+                self._other.append((next(self._seq), packet))
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def get_nowait(self):
+        if self._pings:
+            return self._pings.popleft()
+        positions, other = self._positions, self._other
+        if positions:
+            key = next(iter(positions))
+            if not other or positions[key][0] < other[0][0]:
+                return positions.pop(key)[1]
+        if other:
+            return other.popleft()[1]
+        return None
+
+    async def get(self):
+        while True:
+            packet = self.get_nowait()
+            if packet is not None or self._closed:
+                return packet
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
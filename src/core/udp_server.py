@@ -8,11 +8,13 @@ import asyncio
 import json
 
 from core import utils
+from core.udp_batch import create_reader
 
 
 # noinspection PyProtectedMember
 class UDPServer(asyncio.DatagramTransport):
     transport = None
+    reader = None  # Batched recvmmsg(), if enabled
 
     def __init__(self, core, host=None, port=None):
         super().__init__()
@@ -27,26 +29,27 @@ class UDPServer(asyncio.DatagramTransport):
     def pause_writing(self, *args, **kwargs): ...
     def resume_writing(self, *args, **kwargs): ...
 
-    async def handle_datagram(self, packet, addr):
+    def datagram_received(self, packet, addr):
+        # Hot path: runs right in the protocol callback, no task per datagram
         try:
             cid = packet[0] - 1
             client = self._core.get_client(cid=cid)
             if client:
                 if not client.alive:
                     client.log.debug(f"Still sending UDP data: {packet}")
-                if client._udp_sock != (self.transport, addr):
+                sock = client._udp_sock
+                if sock[1] != addr or sock[0] is not self.transport:
                     client._udp_sock = (self.transport, addr)
                     self.log.debug(f"Set UDP Sock for CID: {cid}")
-                await client._udp_put(packet)
+                client._udp_put_nowait(packet)
             else:
                 self.log.debug(f"[{cid}] Client not found.")
         except Exception as e:
             self.log.error(f"Error handle_datagram: {e}")
 
-    def datagram_received(self, *args, **kwargs):
-        self.loop.create_task(self.handle_datagram(*args, **kwargs))
-
     def connection_lost(self, exc):
+        if self.reader:
+            self.reader.close()
         if exc is not None and exc != KeyboardInterrupt:
             self.log.debug(f'Connection raised: {exc}')
         self.log.debug(f'Disconnected.')
@@ -69,6 +72,11 @@ class UDPServer(asyncio.DatagramTransport):
                     local_addr=(self.host, self.port)
                 )
                 d.transport = self.transport
+                recv_batch = config.Options['udp_recv_batch']
+                d.reader = create_reader(self.transport, p, recv_batch) if recv_batch > 1 else None
+                if d.reader:
+                    d.reader.start()
+                    self.log.debug(f"Using recvmmsg() for UDP, up to {recv_batch} datagrams")
 
                 self.log.debug(f"UDP server started on {self.transport.get_extra_info('sockname')}")
 
@@ -84,6 +92,25 @@ class UDPServer(asyncio.DatagramTransport):
                 self.log.error(f"Error: {e}")
                 self.log.exception(e)
 
+    def parse_console(self, _):
+        reader = self.reader
+        if self.transport is None:
+            return "UDP server is not running."
+        inboxes = [client._udp_inbox for client in self._core.clients if client]
+        out = (f"Inbound queues: {sum(len(i) for i in inboxes)} packets of {len(inboxes)} players; "
+               f"coalesced {sum(i.coalesced for i in inboxes)}; dropped {sum(i.dropped for i in inboxes)}\n")
+        if reader is None:
+            out += "Receive: datagram_received()"
+        else:
+            avg = reader.received / reader.bursts if reader.bursts else 0
+            out += (f"Receive: recvmmsg(); {reader.received} datagrams in {reader.bursts} bursts; "
+                    f"avg {avg:.1f}; max {reader.max_burst}; truncated {reader.truncated}; "
+                    f"errors {reader.errors} (last: {reader.last_error})\n")
+            sizes = [(1 << i, min((2 << i) - 1, reader.max_batch)) for i in range(len(reader.histogram))]
+            out += "Burst sizes: " + "; ".join(
+                f"{lo}-{hi}: {n}" if lo != hi else f"{lo}: {n}" for (lo, hi), n in zip(sizes, reader.histogram))
+        return out
+
     def _stop(self):
         self.log.debug("Stopping UDP server")
         if self.transport:
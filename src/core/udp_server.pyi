@@ -10,10 +10,12 @@ from typing import Tuple, List
 
 from core import utils
 from core.core import Core
+from core.udp_batch import UDPBatchReader
 
 
 class UDPServer(asyncio.DatagramTransport):
     transport: DatagramTransport = None
+    reader: UDPBatchReader | None = None
 
     def __init__(self, core: Core, host=None, port=None, transport=None):
         self.log = utils.get_logger("UDPServer")
@@ -24,8 +26,8 @@ class UDPServer(asyncio.DatagramTransport):
         self.run = False
         # self.transport: DatagramTransport = None
     def connection_made(self, transport: DatagramTransport): ...
-    async def handle_datagram(self, data: bytes, addr: Tuple[str, int]):
     def datagram_received(self, data: bytes, addr: Tuple[str, int]): ...
     async def _print_pps(self) -> None: ...
     async def _start(self) -> None: ...
+    def parse_console(self, x: List[str]) -> str: ...
     async def _stop(self) -> None: ...
\ No newline at end of file
@@ -0,0 +1,238 @@
+# Developed by KuiToi Dev
+# File core.vehicles.py
+# Written by: SantaSpeen
+# Core version: 0.4.8
+# Licence: FPA
+# (c) kuitoi.su 2024
+import copy
+import json
+from array import array
+from collections.abc import Mapping
+
+
+class ConfigStore:
+    """
+    Vehicle configs (the JSON of a spawn packet), deduplicated by text: cars spawned with the same config
+    share one str and one parsed dict. Shared dicts are read-only, an edited car gets its own copy.
+    """
+
+    def __init__(self):
+        self._blobs = {}  # text -> [text, dict, refs]
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def put(self, text):
+        """(text, dict) of the config; raises ValueError if it isn't JSON."""
+        blob = self._blobs.get(text)
+        if blob is None:
+            blob = self._blobs[text] = [text, json.loads(text), 0]
+        else:
+            self.hits += 1
+        blob[2] += 1
+        return blob[0], blob[1]
+
+    def release(self, text):
+        blob = self._blobs.get(text)
+        if blob is not None:
+            blob[2] -= 1
+            if blob[2] <= 0:
+                del self._blobs[text]
+
+    def size(self):
+        return sum(len(text) for text in self._blobs)
+
+
+class Car(Mapping):
+    """
+    Car of a player, read as a read-only dict inside the core. Plugins get to_dict().
+    The spawn packet isn't kept: it's the header + the config text, which is shared through ConfigStore.
+    """
+
+    __slots__ = ("header", "config", "json", "json_ok", "unicycle", "over_spawn", "pos")
+    _fields = ("packet", "json", "json_ok", "unicycle", "over_spawn", "pos")
+
+    def __init__(self, header, config, car_json, unicycle, over_spawn, pos):
+        self.header = header
+        self.config = config
+        self.json = car_json
+        self.json_ok = bool(car_json)
+        self.unicycle = unicycle
+        self.over_spawn = over_spawn
+        self.pos = pos
+
+    @property
+    def packet(self):
+        return self.header + self.config
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        if key == "pos":
+            return self.pos.value  # Position stays in the core
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def to_dict(self):
+        """The car as a plain dict of its own: json is a copy (the stored one may be shared), pos is decoded."""
+        return {"packet": self.packet, "json": copy.deepcopy(self.json), "json_ok": self.json_ok,
+                "unicycle": self.unicycle, "over_spawn": self.over_spawn, "pos": self.pos.value}
+
+    def __repr__(self):
+        return f"Car({dict(self)!r})"
+
+
+class VehicleTable:
+    """
+    State of all cars on the server, one row per (cid, car_id), stored as struct-of-arrays:
+    every field is a flat array('d') with width floats per row, so bulk queries never touch per-car objects.
+    Position packets write pos at once and keep their raw JSON; the other fields are parsed from it
+    only when a query asks for them.
+    """
+
+    fields = {"pos": 3, "rot": 4, "vel": 3, "rvel": 3, "tim": 1}
+
+    def __init__(self):
+        self.configs = ConfigStore()
+        self._rows = {}  # (cid, car_id) -> row
+        self._keys = []  # row -> (cid, car_id) | None
+        self._config = []  # row -> config text | None
+        self._raw = []  # row -> position JSON (bytes) | None
+        self._free = []
+        self._dirty = set()  # Rows with fields older than their raw JSON
+        self._columns = {name: array("d") for name in self.fields}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def add(self, key, config=None):
+        """New car row; config is its text from ConfigStore.put(), released with the row."""
+        self.remove(key)
+        if self._free:
+            row = self._free.pop()
+            for name, width in self.fields.items():
+                column = self._columns[name]
+                for i in range(row * width, row * width + width):
+                    column[i] = 0.0
+        else:
+            row = len(self._keys)
+            self._keys.append(None)
+            self._config.append(None)
+            self._raw.append(None)
+            for name, width in self.fields.items():
+                column = self._columns[name]
+                column.frombytes(bytes(column.itemsize * width))  # zeros
+        self._rows[key] = row
+        self._keys[row] = key
+        self._config[row] = config
+        return row
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        if self._config[row] is not None:
+            self.configs.release(self._config[row])
+        self._keys[row] = self._config[row] = self._raw[row] = None
+        self._dirty.discard(row)
+        self._free.append(row)
+        return True
+
+    def remove_cid(self, cid):
+        for key in [k for k in self._rows if k[0] == cid]:
+            self.remove(key)
+
+    def update(self, key, pos, raw=None):
+        """Position packet of the car: pos [x, y, z] and (optionally) the raw JSON for the other fields."""
+        row = self._rows.get(key)
+        if row is None:
+            return False
+        column = self._columns["pos"]
+        i = row * 3
+        column[i] = pos[0]
+        column[i + 1] = pos[1]
+        column[i + 2] = pos[2]
+        if raw is not None:
+            self._raw[row] = raw
+            self._dirty.add(row)
+        return True
+
+    def _refresh(self):
+        # Bring rot/vel/... up to date with the latest raw JSON of every changed row
+        columns = self._columns
+        for row in self._dirty:
+            try:
+                data = json.loads(self._raw[row].decode())
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            for name, width in self.fields.items():
+                if name == "pos" or name not in data:
+                    continue
+                # Sent by the client: only a full set of numbers gets in, a short one would shift the column
+                value = data[name]
+                if width == 1:
+                    value = [value]
+                if not isinstance(value, list) or len(value) < width:
+                    continue
+                try:
+                    values = array("d", value[:width])
+                except (TypeError, OverflowError):
+                    continue
+                columns[name][row * width:row * width + width] = values
+        self._dirty.clear()
+
+    def get(self, key, field="pos"):
+        """Field of one car as a list of floats, or None if there's no such car."""
+        self.check_field(field)
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        if field != "pos" and self._dirty:
+            self._refresh()
+        width = self.fields[field]
+        return self._columns[field][row * width:row * width + width].tolist()
+
+    @classmethod
+    def check_field(cls, field):
+        if field not in cls.fields:
+            raise ValueError(f"Unknown vehicle field: {field!r}; known: {', '.join(cls.fields)}")
+
+    def keys(self):
+        """(cid, car_id) of all cars, in the order column() returns them."""
+        return [key for key in self._keys if key is not None]
+
+    def column(self, field="pos"):
+        """([(cid, car_id)], array('d')): field of all cars as one flat array, width floats per car."""
+        self.check_field(field)
+        if field != "pos" and self._dirty:
+            self._refresh()
+        width = self.fields[field]
+        column = self._columns[field]
+        if not self._free:
+            return self.keys(), column[:len(self._keys) * width]
+        out = array("d")
+        keys = []
+        for row, key in enumerate(self._keys):
+            if key is not None:
+                keys.append(key)
+                out.extend(column[row * width:row * width + width])
+        return keys, out
+
+    def parse_console(self, x):
+        rows = len(self._keys)
+        size = sum(column.itemsize * len(column) for column in self._columns.values())
+        return (f"Vehicle table: {len(self._rows)} cars in {rows} rows ({len(self._free)} free); "
+                f"fields {size / KB:.1f} KB.\n"
+                f"Configs: {len(self.configs)} unique, {self.configs.size() / KB:.1f} KB; "
+                f"{self.configs.hits} spawns deduplicated.")
@@ -13,13 +13,24 @@ import yaml
 
 
 class Config:
+    _options = {"language": "en", "speed_limit": 0, "use_queue": False, "use_lua": False, "log_chat": True,
+                "send_queue_high": 1, "send_queue_kick": 16, "compress_level": 6, "compress_threshold": 400,
+                "codec_offload_size": 256, "max_downloads": 0, "server_speed_limit": 0,
+                "auth_url": "https://auth.beammp.com/pkToUser",
+                "backend_urls": ["https://backend.beammp.com", "https://backup1.beammp.com",
+                                 "https://backup2.beammp.com"],
+                "http_timeout": 10, "http_hedge_delay": 2, "http_max_requests": 16,
+                "auth_max_requests": 8, "auth_cache_ttl": 300, "auth_queue_timeout": 10,
+                "packets_per_tick": 0, "udp_recv_batch": 0,
+                "culling": "none", "culling_radius": 500, "culling_far_rate": 0.0, "spatial_cell": 100,
+                "lod_near": 0, "lod_far": 0}
+
     def __init__(self, auth=None, game=None, server=None, rcon=None, options=None):
         self.Auth = auth or {"key": None, "private": True}
         self.Game = game or {"map": "gridmap_v2", "players": 8, "cars": 1}
         self.Server = server or {"name": "KuiToi-Server", "description": "Welcome to KuiToi Server!", "tags": "Freroam",
                                  "server_ip": "0.0.0.0", "server_port": 30814}
-        self.Options = options or {"language": "en", "speed_limit": 0, "use_queue": False,
-                                   "use_lua": False, "log_chat": True}
+        self.Options = options or dict(self._options)
         self.RCON = rcon or {"enabled": False, "server_ip": "127.0.0.1", "server_port": 10383,
                              "password": secrets.token_hex(6)}
 
@@ -54,6 +65,9 @@ class ConfigProvider:
             self.config = Config()
             return self.read(True)
 
+        for key, value in Config._options.items():
+            if key not in self.config.Options:
+                self.config.Options[key] = value
         if not self.config.Options.get("debug"):
             self.config.Options['debug'] = False
         if not self.config.Options.get("encoding"):
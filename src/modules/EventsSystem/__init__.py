@@ -116,6 +116,10 @@ class EventsSystem:
                 event_name in self.__events.keys() or
                 event_name in self.__lua_events.keys())
 
+    def has_listeners(self, event_name):
+        return bool(self.__events.get(event_name) or self.__async_events.get(event_name) or
+                    self.__lua_events.get(event_name))
+
     def register(self, event_name, event_func, async_event=False, lua=None):
         self.log.debug(f"register(event_name='{event_name}', event_func='{event_func}', "
                        f"async_event={async_event}, lua_event={lua}):")
@@ -105,6 +105,27 @@ class KuiToi:
             return False
         return bool(self.get_player(cid=pid, nick=nick))
 
+    @staticmethod
+    def _call_core(event_name, *args, **kwargs):
+        # Core returns the error of the call (see Core._plugin_call) instead of letting ev swallow it
+        result = ev.call_event(event_name, *args, **kwargs)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def set_culling(self, policy, **kwargs):
+        self.log.debug(f"Requests set_culling: {policy}")
+        return self._call_core("_set_culling", policy, **kwargs)
+
+    def cars_near(self, pos, radius):
+        return self._call_core("_cars_near", pos, radius)
+
+    def nearest_cars(self, pos, count=1, radius=None):
+        return self._call_core("_nearest_cars", pos, count, radius)
+
+    def vehicle_states(self, field="pos"):
+        return self._call_core("_vehicle_states", field)
+
     def add_command(self, key, func, man, desc, custom_completer) -> dict:
         self.log.debug("Requests add_command")
         self.__funcs.append(func)
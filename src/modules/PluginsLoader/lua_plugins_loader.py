@@ -13,6 +13,7 @@ import toml
 from lupa.lua53 import LuaRuntime
 
 from core import get_logger
+from core.vehicles import VehicleTable
 
 
 class EventTimer:
@@ -186,10 +187,33 @@ class MP:
         if client:
             car = client._cars[car_id]
             if car:
-                return self._lua.table_from(car['pos'])
+                return self._lua.table_from(car.pos.value)
             return self._lua.table(), "Vehicle not found"
         return self._lua.table(), "Client expired"
 
+    def _vehicles_table(self, found):
+        if isinstance(found, Exception):  # Returned by Core._plugin_call
+            return self._lua.table(), str(found)
+        return self._lua.table_from([self._lua.table_from({"player_id": client.cid, "vehicle_id": car_id,
+                                                           "distance": distance})
+                                     for client, car_id, distance in found])
+
+    def GetVehiclesInRadius(self, x, y, z, radius):
+        self.log.debug("request GetVehiclesInRadius()")
+        return self._vehicles_table(ev.call_event("_cars_near", [x, y, z], radius)[0])
+
+    def GetNearestVehicles(self, x, y, z, count=1, radius=None):
+        self.log.debug("request GetNearestVehicles()")
+        return self._vehicles_table(ev.call_event("_nearest_cars", [x, y, z], int(count), radius)[0])
+
+    def GetVehicleStates(self, field="pos"):
+        self.log.debug("request GetVehicleStates()")
+        if field not in VehicleTable.fields:
+            return self._lua.table(), self._lua.table(), "Unknown field"
+        keys, values = ev.call_event("_vehicle_states", field)[0]
+        ids = [i for key in keys for i in key]
+        return self._lua.table_from(ids), self._lua.table_from(values.tolist())
+
     def IsPlayerConnected(self, player_id):
         self.log.debug("request IsPlayerConnected()")
         if player_id < 0:
@@ -63,6 +63,7 @@ class MultiLanguage:
             "core_player_kick_bad_key": "Invalid key passed!",
             "core_player_kick_invalid_key": "Invalid key! Please restart your game.",
             "core_player_kick_auth_server_fail": "BeamMP authentication server failed! Please try to connect again in 5 minutes.",
+            "core_player_kick_auth_busy": "Authentication queue is full. Please try to connect again in a minute.",
             "core_player_kick_stale": "Stale client. (Replaced by new connection)",
             "core_player_kick_no_allowed_default_reason": "You are not welcome on this server. Access denied.",
             "core_player_kick_server_full": "Server is full.",